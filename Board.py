@@ -1,100 +1,450 @@
-from copy import deepcopy
+import random
+
+EMPTY = 0
+BLACK = 8  # 黑方棋子编码带有该位，红方棋子编码为 1-7，黑方为 9-15
+
+# 棋子编码表，下标即编码，编码 0 与 8 都表示空位
+PIECE_CHARS = '_RNBAKCP_rnbakcp'
+PIECE_CODES = {piece: code for code, piece in enumerate(PIECE_CHARS) if piece != '_'}
+PIECE_CODES['_'] = EMPTY
+
+ROWS = 10
+COLS = 9
+NUM_SQUARES = ROWS * COLS
+
+# 编码 -> 字符的翻译表，encode() 直接用 bytes.translate 生成局面字符串
+_ENCODE_TABLE = bytes(ord(PIECE_CHARS[code]) if code < len(PIECE_CHARS) else ord('_') for code in range(256))
+
+INITIAL_BOARD = [
+    ['r', 'n', 'b', 'a', 'k', 'a', 'b', 'n', 'r'],
+    ['_', '_', '_', '_', '_', '_', '_', '_', '_'],
+    ['_', 'c', '_', '_', '_', '_', '_', 'c', '_'],
+    ['p', '_', 'p', '_', 'p', '_', 'p', '_', 'p'],
+    ['_', '_', '_', '_', '_', '_', '_', '_', '_'],
+    ['_', '_', '_', '_', '_', '_', '_', '_', '_'],
+    ['P', '_', 'P', '_', 'P', '_', 'P', '_', 'P'],
+    ['_', 'C', '_', '_', '_', '_', '_', 'C', '_'],
+    ['_', '_', '_', '_', '_', '_', '_', '_', '_'],
+    ['R', 'N', 'B', 'A', 'K', 'A', 'B', 'N', 'R']
+]
+
+
+def to_square(position):
+    x, y = position
+    return x * COLS + y
+
+
+def to_position(square):
+    return divmod(square, COLS)
+
+
+def is_black_piece(code):
+    return code & BLACK != 0
+
+
+# 走子表在导入时一次性生成，按格子下标（以及红黑方）索引，走子生成只需遍历这些表
+KING, ADVISOR, BISHOP, KNIGHT, ROOK, CANNON, PAWN = (PIECE_CODES[piece] for piece in 'KABNRCP')
+
+POSITIONS = tuple(to_position(square) for square in range(NUM_SQUARES))
+
+_ORTHOGONAL = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+
+
+def _on_board(x, y):
+    return 0 <= x < ROWS and 0 <= y < COLS
+
+
+def _in_palace(x, y, black):
+    return 3 <= y <= 5 and (0 <= x <= 2 if black else 7 <= x <= 9)
+
+
+def _build_king_table(black):
+    # 宫内一步走子；flying 为将帅对脸时需要扫描的方向（红帅向上，黑将向下）
+    table = []
+    for x, y in POSITIONS:
+        steps = []
+        for dx, dy in _ORTHOGONAL:
+            nx, ny = x + dx, y + dy
+            if not _on_board(nx, ny):
+                continue
+            target = nx * COLS + ny if _in_palace(nx, ny, black) else None
+            flying = None
+            if (dx, dy) == ((1, 0) if black else (-1, 0)):
+                flying = [i * COLS + y for i in (range(nx, ROWS) if black else range(nx, -1, -1))]
+            steps.append((target, flying))
+        table.append(steps)
+    return table
+
+
+def _build_advisor_table(black):
+    table = []
+    for x, y in POSITIONS:
+        table.append([nx * COLS + ny for nx, ny in ((x + dx, y + dy) for dx, dy in [(-1, -1), (-1, 1), (1, -1), (1, 1)])
+                      if _on_board(nx, ny) and _in_palace(nx, ny, black)])
+    return table
+
+
+def _build_bishop_table(black):
+    # (目标格, 象眼)
+    table = []
+    for x, y in POSITIONS:
+        moves = []
+        for dx, dy in [(-2, -2), (-2, 2), (2, -2), (2, 2)]:
+            nx, ny = x + dx, y + dy
+            if _on_board(nx, ny) and (0 <= nx <= 4 if black else 5 <= nx <= 9):
+                moves.append((nx * COLS + ny, (x + dx // 2) * COLS + y + dy // 2))
+        table.append(moves)
+    return table
+
+
+def _build_knight_table():
+    # (目标格, 马腿)
+    table = []
+    for x, y in POSITIONS:
+        moves = []
+        for dx, dy in [(-1, -2), (1, -2), (-1, 2), (1, 2), (-2, -1), (-2, 1), (2, -1), (2, 1)]:
+            nx, ny = x + dx, y + dy
+            if _on_board(nx, ny):
+                leg = (x + dx // 2) * COLS + y if dx in (2, -2) else x * COLS + y + dy // 2
+                moves.append((nx * COLS + ny, leg))
+        table.append(moves)
+    return table
+
+
+def _build_ray_table():
+    # 车/炮四个方向上由近到远的格子
+    table = []
+    for x, y in POSITIONS:
+        rays = []
+        for dx, dy in _ORTHOGONAL:
+            ray = []
+            nx, ny = x + dx, y + dy
+            while _on_board(nx, ny):
+                ray.append(nx * COLS + ny)
+                nx, ny = nx + dx, ny + dy
+            rays.append(ray)
+        table.append(rays)
+    return table
+
+
+def _build_pawn_table(black):
+    table = []
+    for x, y in POSITIONS:
+        if black:
+            directions = [(1, 0)] + ([(0, 1), (0, -1)] if x >= 5 else [])
+        else:
+            directions = [(-1, 0)] + ([(0, 1), (0, -1)] if x <= 4 else [])
+        table.append([nx * COLS + ny for nx, ny in ((x + dx, y + dy) for dx, dy in directions) if _on_board(nx, ny)])
+    return table
+
+
+def _build_knight_attack_table():
+    # 反查表：能跳到该格的 (马所在格, 马腿)
+    table = [[] for _ in range(NUM_SQUARES)]
+    for square in range(NUM_SQUARES):
+        for target_square, leg in KNIGHT_MOVES[square]:
+            table[target_square].append((square, leg))
+    return table
+
+
+def _build_pawn_attack_table(black):
+    # 反查表：该方的兵/卒从哪些格子可以走到该格
+    table = [[] for _ in range(NUM_SQUARES)]
+    for square in range(NUM_SQUARES):
+        for target_square in PAWN_MOVES[black][square]:
+            table[target_square].append(square)
+    return table
+
+
+def _build_exposure_table():
+    # 将帅在 king 格时，起点或终点落在这些格子上的走子才可能让己方被将：
+    # 同行同列（车、炮、对脸的线路及炮架）和斜向相邻格（马腿）
+    table = []
+    for x, y in POSITIONS:
+        table.append(bytes(nx == x or ny == y or (abs(nx - x) == 1 and abs(ny - y) == 1) for nx, ny in POSITIONS))
+    return table
+
+
+# 以 is_black_piece() 的结果（False/True）作为红/黑方下标
+KING_MOVES = (_build_king_table(False), _build_king_table(True))
+ADVISOR_MOVES = (_build_advisor_table(False), _build_advisor_table(True))
+BISHOP_MOVES = (_build_bishop_table(False), _build_bishop_table(True))
+KNIGHT_MOVES = _build_knight_table()
+RAYS = _build_ray_table()
+PAWN_MOVES = (_build_pawn_table(False), _build_pawn_table(True))
+KNIGHT_ATTACKS = _build_knight_attack_table()
+PAWN_ATTACKS = (_build_pawn_attack_table(False), _build_pawn_attack_table(True))
+EXPOSURE = _build_exposure_table()
+
+# 连续 60 步没有吃子判和；同一局面（含轮到哪方）第 3 次出现判和
+MAX_STEPS_NO_CAPTURE = 60
+REPETITION_LIMIT = 3
+
+# Zobrist 随机数，固定种子保证不同进程得到相同的局面哈希
+_zobrist_random = random.Random(20230916)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) if code & 7 else 0 for _ in range(NUM_SQUARES)]
+                  for code in range(len(PIECE_CHARS))]
+ZOBRIST_BLACK_TURN = _zobrist_random.getrandbits(64)
 
 
 class Board:
+    # 棋盘用 90 格的 bytearray 保存棋子编码，clone() 只需要复制一次缓冲区
+    # _history 为上次吃子以来各局面的哈希，用于判断重复局面；_mobility_checked 表示是否已判断过当前一方无棋可走
+    __slots__ = ('squares', '_red_turn', '_is_game_over', '_num_steps_no_capture', '_winner', '_hash', '_history',
+                 '_mobility_checked')
+
     def __init__(self, board=None):
-        self.board = [
-            ['r', 'n', 'b', 'a', 'k', 'a', 'b', 'n', 'r'],
-            ['_', '_', '_', '_', '_', '_', '_', '_', '_'],
-            ['_', 'c', '_', '_', '_', '_', '_', 'c', '_'],
-            ['p', '_', 'p', '_', 'p', '_', 'p', '_', 'p'],
-            ['_', '_', '_', '_', '_', '_', '_', '_', '_'],
-            ['_', '_', '_', '_', '_', '_', '_', '_', '_'],
-            ['P', '_', 'P', '_', 'P', '_', 'P', '_', 'P'],
-            ['_', 'C', '_', '_', '_', '_', '_', 'C', '_'],
-            ['_', '_', '_', '_', '_', '_', '_', '_', '_'],
-            ['R', 'N', 'B', 'A', 'K', 'A', 'B', 'N', 'R']
-        ]
-        self.player_1 = 'red'  # player_1 表示轮到谁走，player_2表示上一步是谁走的
-        self.player_2 = 'black'
+        rows = INITIAL_BOARD if board is None else board
+        self.squares = bytearray(PIECE_CODES[piece] for row in rows for piece in row)
+        self._red_turn = True  # 轮到红方走棋时为 True
         self._is_game_over = False
         self._num_steps_no_capture = 0
         self._winner = None
+        self._hash = self.compute_hash()
+        self._history = [self._hash]
+        self._mobility_checked = False
 
     def move(self, start_pos, end_pos):
         next_board = self.clone()
         if not next_board.is_game_over():
-            start_x, start_y = start_pos
-            end_x, end_y = end_pos
-            piece = next_board.board[start_x][start_y]
-            target = next_board.board[end_x][end_y]
-
             if next_board.is_valid_move(start_pos, end_pos):
-                next_board.board[end_x][end_y] = piece
-                next_board.board[start_x][start_y] = '_'
-
-                if target.lower() == 'k':
-                    next_board._is_game_over = True
-
-                    if target.islower():
-                        next_board._winner = 'red'
-                    else:
-                        next_board._winner = 'black'
-
-            if target != '_':
-                next_board._num_steps_no_capture = 0
+                next_board.make_move(start_pos, end_pos)
             else:
-                next_board._num_steps_no_capture += 1
+                if next_board.squares[to_square(end_pos)] != EMPTY:
+                    next_board._num_steps_no_capture = 0
+                else:
+                    next_board._num_steps_no_capture += 1
 
-            (next_board.player_1, next_board.player_2) = (next_board.player_2, next_board.player_1)
+                next_board._red_turn = not next_board._red_turn
+                next_board._hash ^= ZOBRIST_BLACK_TURN
+                next_board._mobility_checked = False
         return next_board
 
+    def make_move(self, start_pos, end_pos):
+        # 原地走子，不做合法性检查，返回 unmake_move() 需要的撤销记录
+        squares = self.squares
+        start = to_square(start_pos)
+        end = to_square(end_pos)
+        target = squares[end]
+        piece = squares[start]
+        undo = (start, end, target, self._num_steps_no_capture, self._winner, self._is_game_over, self._hash,
+                self._history, self._mobility_checked)
+
+        squares[end] = piece
+        squares[start] = EMPTY
+        self._hash ^= (ZOBRIST_PIECES[piece][start] ^ ZOBRIST_PIECES[piece][end] ^ ZOBRIST_PIECES[target][end]
+                       ^ ZOBRIST_BLACK_TURN)
+        self._red_turn = not self._red_turn
+        self._mobility_checked = False
+
+        if target != EMPTY:
+            if target & 7 == KING:
+                self._is_game_over = True
+                self._winner = 'red' if is_black_piece(target) else 'black'
+            self._num_steps_no_capture = 0
+            # 吃子后之前的局面不可能再出现，换一个新列表，旧列表留给 unmake_move 恢复
+            self._history = [self._hash]
+        else:
+            self._num_steps_no_capture += 1
+            self._history.append(self._hash)
+            if self._num_steps_no_capture >= MAX_STEPS_NO_CAPTURE or \
+                    self._history.count(self._hash) >= REPETITION_LIMIT:
+                self._is_game_over = True
+
+        return undo
+
+    def unmake_move(self, undo):
+        (start, end, target, num_steps_no_capture, winner, is_game_over, position_hash, history,
+         mobility_checked) = undo
+        squares = self.squares
+        squares[start] = squares[end]
+        squares[end] = target
+        if target == EMPTY:
+            history.pop()
+        self._history = history
+        self._num_steps_no_capture = num_steps_no_capture
+        self._winner = winner
+        self._is_game_over = is_game_over
+        self._red_turn = not self._red_turn
+        self._hash = position_hash
+        self._mobility_checked = mobility_checked
+
+    def zobrist_hash(self):
+        # 64 位局面哈希（含轮到哪方走），作为子节点表、缓存和重复局面检测的键
+        return self._hash
+
+    def hash_after_move(self, start_pos, end_pos):
+        # 不走子直接算出走子后的哈希
+        squares = self.squares
+        start = to_square(start_pos)
+        end = to_square(end_pos)
+        piece = squares[start]
+        return (self._hash ^ ZOBRIST_PIECES[piece][start] ^ ZOBRIST_PIECES[piece][end]
+                ^ ZOBRIST_PIECES[squares[end]][end] ^ ZOBRIST_BLACK_TURN)
+
+    def table_key(self):
+        # 置换表的键：局面哈希加未吃子步数，两者相同的局面离 60 步和棋一样近
+        # 当前局面已在 _history 里出现过时，是否判和取决于走到这里的顺序，返回 None 表示不共享
+        if self._history.count(self._hash) > 1:
+            return None
+        return self._hash, self._num_steps_no_capture
+
+    def table_key_after_move(self, start_pos, end_pos):
+        # 不走子直接算出走子后的 table_key()
+        position_hash = self.hash_after_move(start_pos, end_pos)
+        if self.squares[to_square(end_pos)] != EMPTY:
+            return position_hash, 0
+        if position_hash in self._history:
+            return None
+        return position_hash, self._num_steps_no_capture + 1
+
+    def compute_hash(self):
+        position_hash = 0 if self._red_turn else ZOBRIST_BLACK_TURN
+        for square, piece in enumerate(self.squares):
+            position_hash ^= ZOBRIST_PIECES[piece][square]
+        return position_hash
+
+    def piece_at(self, x, y):
+        return PIECE_CHARS[self.squares[x * COLS + y]]
+
     def encode(self):
-        return "".join(["".join(row) for row in self.board])
+        return self.squares.translate(_ENCODE_TABLE).decode('ascii')
+
+    def legal_moves(self):
+        # 只生成 (src, dst)，不构造后继局面，顺序与 possible_moves() 一致；走后己方被将（含将帅对脸）的走法被过滤掉
+        squares = self.squares
+        black = self.is_black_turn()
+        king = self._king_square(black)
+        in_check = king >= 0 and self.is_attacked(king, black)
+        for square in range(NUM_SQUARES):
+            piece = squares[square]
+            if piece != EMPTY and (piece & BLACK != 0) == black:
+                position = POSITIONS[square]
+                for target_square in self._piece_moves(square):
+                    if self._is_safe_move(square, target_square, king, in_check):
+                        yield position, POSITIONS[target_square]
+
+    def legal_move_list(self):
+        # 生成全部合法走法的列表，顺便记下当前一方是否无棋可走，之后的 is_game_over() 不必再生成一遍
+        moves = list(self.legal_moves())
+        if not self._is_game_over and not self._mobility_checked:
+            self._mobility_checked = True
+            if len(moves) == 0:
+                self._is_game_over = True
+                self._winner = 'black' if self._red_turn else 'red'
+        return moves
+
+    def count_moves(self):
+        return sum(1 for _ in self.legal_moves())
+
+    def has_legal_move(self):
+        return next(self.legal_moves(), None) is not None
+
+    def is_in_check(self):
+        black = self.is_black_turn()
+        king = self._king_square(black)
+        return king >= 0 and self.is_attacked(king, black)
+
+    def is_attacked(self, square, black):
+        """black 一方在 square 格的棋子是否被对方攻击，从该格反查车、炮、对脸的将帅、马和兵。"""
+        squares = self.squares
+        enemy = 0 if black else BLACK
+        for ray in RAYS[square]:
+            has_screen = False
+            for target_square in ray:
+                target = squares[target_square]
+                if target == EMPTY:
+                    continue
+                if not has_screen:
+                    # 将帅只会在同一列相遇，射线上第一个棋子是对方的将帅即为对脸
+                    if target & BLACK == enemy and (target & 7 == ROOK or target & 7 == KING):
+                        return True
+                    has_screen = True
+                else:
+                    if target == CANNON | enemy:
+                        return True
+                    break
+        knight = KNIGHT | enemy
+        for knight_square, leg in KNIGHT_ATTACKS[square]:
+            if squares[knight_square] == knight and squares[leg] == EMPTY:
+                return True
+        pawn = PAWN | enemy
+        for pawn_square in PAWN_ATTACKS[not black][square]:
+            if squares[pawn_square] == pawn:
+                return True
+        return False
+
+    def _king_square(self, black):
+        return self.squares.find(KING | BLACK if black else KING)
+
+    def _is_safe_move(self, square, target_square, king, in_check):
+        # 走完后己方将帅是否不被攻击；没被将时只有起点、终点与将帅同线或在马腿上的走子需要检查
+        if king < 0:
+            return True
+        exposure = EXPOSURE[king]
+        if not in_check and square != king and not exposure[square] and not exposure[target_square]:
+            return True
+        squares = self.squares
+        piece = squares[square]
+        target = squares[target_square]
+        squares[target_square] = piece
+        squares[square] = EMPTY
+        safe = not self.is_attacked(target_square if square == king else king, piece & BLACK != 0)
+        squares[square] = piece
+        squares[target_square] = target
+        return safe
+
+    def apply_move(self, start_pos, end_pos):
+        # 生成走子后的新局面，走子须来自 legal_moves()
+        next_board = self.clone()
+        next_board.make_move(start_pos, end_pos)
+        return next_board
 
     def possible_moves(self):
-        next_states = []
-        for x in range(10):
-            for y in range(9):
-                piece = self.board[x][y]
-                if piece != '_' and piece.islower() == self.is_black_turn():
-                    piece_moves = self.__get_piece_moves__((x, y))
-                    for move in piece_moves:
-                        next_states.append((self.move((x, y), move), (x, y), move))
-        return next_states
+        return [(self.apply_move(src, dst), src, dst) for src, dst in self.legal_moves()]
 
     def is_game_over(self):
+        # 吃掉将帅、和棋在走子时判断；轮到的一方无棋可走（被将死或困毙）在第一次询问时判断，判负
+        if not self._is_game_over and not self._mobility_checked:
+            self._mobility_checked = True
+            if not self.has_legal_move():
+                self._is_game_over = True
+                self._winner = 'black' if self._red_turn else 'red'
         return self._is_game_over
 
     def is_red_win(self):
-        return self._winner == 'red'
+        return self.is_game_over() and self._winner == 'red'
 
     def is_black_win(self):
-        return self._winner == 'black'
+        return self.is_game_over() and self._winner == 'black'
 
     def is_red_turn(self):
-        return self.player_1 == 'red'
+        return self._red_turn
 
     def is_black_turn(self):
-        return self.player_1 == 'black'
+        return not self._red_turn
 
     def is_last_red_turn(self):
-        return self.player_2 == 'red'
+        return not self._red_turn
 
     def is_last_black_turn(self):
-        return self.player_2 == 'black'
+        return self._red_turn
 
     def is_draw(self):
-        return self._num_steps_no_capture >= 60
+        # 60 步未吃子或同一局面重复出现 3 次
+        return self.is_game_over() and self._winner is None
+
+    def is_repetition(self):
+        return self._history.count(self._hash) >= REPETITION_LIMIT
 
     def get_all_piece_position(self):
         piece_positions = {}
-        for i, row in enumerate(self.board):
-            for j, piece in enumerate(row):
-                if piece != '_':
-                    if piece not in piece_positions:
-                        piece_positions[piece] = []
-                    piece_positions[piece].append((i, j))
+        for square, code in enumerate(self.squares):
+            if code != EMPTY:
+                piece = PIECE_CHARS[code]
+                if piece not in piece_positions:
+                    piece_positions[piece] = []
+                piece_positions[piece].append(to_position(square))
         return piece_positions
 
     def dump(self):
@@ -113,242 +463,116 @@ class Board:
         for x in range(10):
             row = []
             for y in range(9):
-                piece = self.board[x][y]
+                piece = self.piece_at(x, y)
                 row.append(board_symbols[piece])
             print(f"{x} {' '.join(row)}")
 
     def clone(self):
-        board = Board()
-        board.__dict__ = deepcopy(self.__dict__)
+        board = Board.__new__(Board)
+        board.squares = self.squares[:]
+        board._red_turn = self._red_turn
+        board._is_game_over = self._is_game_over
+        board._num_steps_no_capture = self._num_steps_no_capture
+        board._winner = self._winner
+        board._hash = self._hash
+        board._history = self._history[:]
+        board._mobility_checked = self._mobility_checked
         return board
 
     def __get_piece_moves__(self, position):
-        x, y = position
-        piece = self.board[x][y]
-
-        piece_type = piece.lower()
-        moves = []
-
-        if piece_type == 'k':
-            moves = self.__get_piece_king_moves__(position)
-        elif piece_type == 'a':
-            moves = self.__get_piece_advisor_moves__(position)
-        elif piece_type == 'b':
-            moves = self.__get_piece_bison_moves__(position)
-        elif piece_type == 'n':
-            moves = self.__get_piece_knight_moves__(position)
-        elif piece_type == 'r':
-            moves = self.__get_piece_rook_moves__(position)
-        elif piece_type == 'c':
-            moves = self.__get_piece_canon_moves__(position)
-        elif piece_type == 'p':
-            moves = self.__get_piece_pawn_moves__(position)
-
-        return moves
-
-    def __get_piece_king_moves__(self, position):
-        x, y = position
-        piece = self.board[x][y]
+        square = to_square(position)
+        black = self.squares[square] & BLACK != 0
+        king = self._king_square(black)
+        in_check = king >= 0 and self.is_attacked(king, black)
+        return [POSITIONS[target_square] for target_square in self._piece_moves(square)
+                if self._is_safe_move(square, target_square, king, in_check)]
+
+    def _piece_moves(self, square):
+        # 返回该格棋子所有走法的目标格下标
+        squares = self.squares
+        piece = squares[square]
+        black = piece & BLACK != 0
+        piece_type = piece & 7
         moves = []
 
-        directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
-
-        for dx, dy in directions:
-            nx, ny = x + dx, y + dy
-
-            if 0 <= nx < 10 and 0 <= ny < 9:
-                # 帅/将的宫限制
-                if piece.islower() and (0 <= nx <= 2) and (3 <= ny <= 5):
-                    target = self.board[nx][ny]
-                    if target == '_' or target.isupper():
-                        moves.append((nx, ny))
-                elif piece.isupper() and (7 <= nx <= 9) and (3 <= ny <= 5):
-                    target = self.board[nx][ny]
-                    if target == '_' or target.islower():
-                        moves.append((nx, ny))
-
-                if piece == 'K' and nx == x - 1 and ny == y:
+        if piece_type == ROOK:
+            for ray in RAYS[square]:
+                for target_square in ray:
+                    target = squares[target_square]
+                    if target == EMPTY:
+                        moves.append(target_square)
+                    else:
+                        if (target & BLACK != 0) != black:
+                            moves.append(target_square)
+                        break
+        elif piece_type == KNIGHT:
+            for target_square, leg in KNIGHT_MOVES[square]:
+                # 没有被蹩腿
+                if squares[leg] == EMPTY:
+                    target = squares[target_square]
+                    if target == EMPTY or (target & BLACK != 0) != black:
+                        moves.append(target_square)
+        elif piece_type == CANNON:
+            for ray in RAYS[square]:
+                has_cannon = False
+                for target_square in ray:
+                    target = squares[target_square]
+                    if not has_cannon:
+                        if target == EMPTY:
+                            moves.append(target_square)
+                        else:
+                            has_cannon = True
+                    elif target != EMPTY:
+                        if (target & BLACK != 0) != black:
+                            moves.append(target_square)
+                        break
+        elif piece_type == PAWN:
+            for target_square in PAWN_MOVES[black][square]:
+                target = squares[target_square]
+                if target == EMPTY or (target & BLACK != 0) != black:
+                    moves.append(target_square)
+        elif piece_type == BISHOP:
+            for target_square, eye in BISHOP_MOVES[black][square]:
+                # 没有塞象眼
+                if squares[eye] == EMPTY:
+                    target = squares[target_square]
+                    if target == EMPTY or (target & BLACK != 0) != black:
+                        moves.append(target_square)
+        elif piece_type == ADVISOR:
+            for target_square in ADVISOR_MOVES[black][square]:
+                target = squares[target_square]
+                if target == EMPTY or (target & BLACK != 0) != black:
+                    moves.append(target_square)
+        elif piece_type == KING:
+            enemy_king = KING if black else KING | BLACK
+            for target_square, flying in KING_MOVES[black][square]:
+                if target_square is not None:
+                    target = squares[target_square]
+                    if target == EMPTY or (target & BLACK != 0) != black:
+                        moves.append(target_square)
+                if flying is not None:
                     # 判断将/帅之间是否隔着棋子
-                    for i in range(x - 1, -1, -1):
-                        if self.board[i][y] != '_' and self.board[i][y] != 'k':
+                    for target_square in flying:
+                        target = squares[target_square]
+                        if target == enemy_king:
+                            moves.append(target_square)
                             break
-                        if self.board[i][y] == 'k':
-                            moves.append((i, y))
+                        if target != EMPTY:
                             break
 
-                elif piece == 'k' and nx == x + 1 and ny == y:
-                    for i in range(x + 1, 10):
-                        if self.board[i][y] != '_' and self.board[i][y] != 'K':
-                            break
-                        if self.board[i][y] == 'K':
-                            moves.append((i, y))
-
-        return moves
-
-    def __get_piece_advisor_moves__(self, position):
-        x, y = position
-        piece = self.board[x][y]
-        moves = []
-
-        directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-
-        for dx, dy in directions:
-            nx, ny = x + dx, y + dy
-
-            if 0 <= nx < 10 and 0 <= ny < 9:
-                # 士/仕的宫限制
-                if piece.islower() and (3 <= ny <= 5) and (0 <= nx <= 2):
-                    target = self.board[nx][ny]
-                    if target == '_' or target.isupper():
-                        moves.append((nx, ny))
-                elif piece.isupper() and (3 <= ny <= 5) and (7 <= nx <= 9):
-                    target = self.board[nx][ny]
-                    if target == '_' or target.islower():
-                        moves.append((nx, ny))
-
-        return moves
-
-    def __get_piece_bison_moves__(self, position):
-        x, y = position
-        piece = self.board[x][y]
-        moves = []
-
-        directions = [(-2, -2), (-2, 2), (2, -2), (2, 2)]
-
-        for dx, dy in directions:
-            nx, ny = x + dx, y + dy
-
-            # 确保在棋盘内
-            if 0 <= nx < 10 and 0 <= ny < 9:
-                target = self.board[nx][ny]
-                # 没有越过河
-                if piece.islower() and (0 <= nx <= 4) or piece.isupper() and (5 <= nx <= 9):
-                    # 没有被蹩腿
-                    blocking_x, blocking_y = (x + dx // 2, y + dy // 2)
-                    blocking_piece = self.board[blocking_x][blocking_y]
-                    if blocking_piece == '_':
-                        if target == '_' or piece.islower() != target.islower():
-                            moves.append((nx, ny))
-
-        return moves
-
-    def __get_piece_rook_moves__(self, position):
-        x, y = position
-        piece = self.board[x][y]
-        moves = []
-
-        directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
-
-        for dx, dy in directions:
-            nx, ny = x + dx, y + dy
-
-            while 0 <= nx < 10 and 0 <= ny < 9:
-                target = self.board[nx][ny]
-                if target == '_':
-                    moves.append((nx, ny))
-                else:
-                    if piece.islower() != target.islower():
-                        moves.append((nx, ny))
-                    break
-
-                nx, ny = nx + dx, ny + dy
-
-        return moves
-
-    def __get_piece_knight_moves__(self, position):
-        x, y = position
-        piece = self.board[x][y]
-        moves = []
-
-        offsets = [
-            (-1, -2), (1, -2), (-1, 2), (1, 2),
-            (-2, -1), (-2, 1), (2, -1), (2, 1)
-        ]
-
-        for dx, dy in offsets:
-            nx, ny = x + dx, y + dy
-
-            # 确保在棋盘内
-            if 0 <= nx < 10 and 0 <= ny < 9:
-                target = self.board[nx][ny]
-                # 没有被蹩腿
-                blocking_x, blocking_y = x, y
-                if dx == 2 or dx == -2:
-                    blocking_x = x + dx // 2
-                elif dy == 2 or dy == -2:
-                    blocking_y = y + dy // 2
-                blocking_piece = self.board[blocking_x][blocking_y]
-                if blocking_piece == '_':
-                    if target == '_' or piece.islower() != target.islower():
-                        moves.append((nx, ny))
-
-        return moves
-
-    def __get_piece_canon_moves__(self, position):
-        x, y = position
-        piece = self.board[x][y]
-        moves = []
-
-        directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
-
-        for dx, dy in directions:
-            nx, ny = x + dx, y + dy
-            has_cannon = False
-
-            while 0 <= nx < 10 and 0 <= ny < 9:
-                target = self.board[nx][ny]
-
-                if not has_cannon:
-                    if target == '_':
-                        moves.append((nx, ny))
-                    else:
-                        has_cannon = True
-                else:
-                    if target != '_':
-                        if piece.islower() != target.islower():
-                            moves.append((nx, ny))
-                        break
-
-                nx, ny = nx + dx, ny + dy
-
-        return moves
-
-    def __get_piece_pawn_moves__(self, position):
-        x, y = position
-        piece = self.board[x][y]
-        moves = []
-
-        if piece.islower():
-            directions = [(1, 0)]
-            if x >= 5:
-                directions.extend([(0, 1), (0, -1)])
-        else:
-            directions = [(-1, 0)]
-            if x <= 4:
-                directions.extend([(0, 1), (0, -1)])
-
-        for dx, dy in directions:
-            nx, ny = x + dx, y + dy
-
-            if 0 <= nx < 10 and 0 <= ny < 9:
-                target = self.board[nx][ny]
-                if target == '_' or piece.islower() != target.islower():
-                    moves.append((nx, ny))
-
         return moves
 
     def is_valid_move(self, start_pos, end_pos):
-        start_x, start_y = start_pos
-        piece = self.board[start_x][start_y]
+        piece = self.squares[to_square(start_pos)]
 
         # 如果起始位置没有棋子，返回False
-        if piece == '_':
+        if piece == EMPTY:
             return False
 
         # 确保棋子的颜色与当前回合颜色相符
-        if self.is_red_turn() and piece.islower():
+        if self.is_red_turn() and is_black_piece(piece):
             return False
-        if not self.is_red_turn() and piece.isupper():
+        if not self.is_red_turn() and not is_black_piece(piece):
             return False
 
         # 获取给定棋子的所有合法走子
@@ -356,3 +580,95 @@ class Board:
 
         # 检查终止位置是否在合法走子中
         return end_pos in legal_moves
+
+
+def test_make_unmake():
+    rng = random.Random(0)
+    for _ in range(20):
+        board = Board()
+        history = []
+        while not board.is_game_over() and len(history) < 200:
+            before = board.clone()
+            _, src, dst = rng.choice(board.possible_moves())
+            undo = board.make_move(src, dst)
+            assert board.encode() == before.move(src, dst).encode(), "make_move differs from move"
+            board.unmake_move(undo)
+            assert board.squares == before.squares, "unmake_move did not restore squares"
+            assert board._red_turn == before._red_turn, "unmake_move did not restore turn"
+            assert board._num_steps_no_capture == before._num_steps_no_capture, "unmake_move did not restore counter"
+            assert board._winner == before._winner, "unmake_move did not restore winner"
+            assert board._is_game_over == before._is_game_over, "unmake_move did not restore game over"
+            assert board.zobrist_hash() == before.zobrist_hash(), "unmake_move did not restore hash"
+            history.append((board.make_move(src, dst), before))
+
+        for undo, before in reversed(history):
+            board.unmake_move(undo)
+            assert board.encode() == before.encode(), "unwinding the game did not restore the position"
+            assert board.is_red_turn() == before.is_red_turn(), "unwinding the game did not restore the turn"
+
+
+def test_zobrist_hash():
+    rng = random.Random(1)
+    for _ in range(20):
+        board = Board()
+        seen = {board.zobrist_hash(): board.encode() + str(board.is_red_turn())}
+        while not board.is_game_over():
+            src, dst = rng.choice(list(board.legal_moves()))
+            expected = board.hash_after_move(src, dst)
+            board.make_move(src, dst)
+            assert board.zobrist_hash() == expected, "hash_after_move differs from make_move"
+            assert board.zobrist_hash() == board.compute_hash(), "incremental hash differs from full hash"
+            state = board.encode() + str(board.is_red_turn())
+            assert seen.setdefault(board.zobrist_hash(), state) == state, "hash collision"
+
+
+def test_check_and_terminal():
+    def empty_rows(**pieces):
+        rows = [['_'] * COLS for _ in range(ROWS)]
+        for piece, squares in pieces.items():
+            for x, y in squares:
+                rows[x][y] = piece
+        return rows
+
+    # 马腿被塞住就不再将军
+    board = Board(empty_rows(k=[(0, 4)], K=[(9, 4)], n=[(7, 3)], P=[(6, 4)]))
+    assert board.is_in_check(), "knight check not detected"
+    board.squares[to_square((8, 3))] = PIECE_CODES['A']
+    assert not board.is_in_check(), "blocked knight leg still gives check"
+
+    # 将帅之间只隔一个车：车离开这一列会造成对脸
+    board = Board(empty_rows(k=[(0, 4)], K=[(9, 4)], R=[(5, 4)]))
+    assert all(dst[1] == 4 for src, dst in board.legal_moves() if src == (5, 4)), "rook exposed the kings"
+    assert not board.is_valid_move((5, 4), (5, 0)), "is_valid_move allowed flying general"
+
+    # 双车错杀
+    board = Board(empty_rows(k=[(0, 4)], K=[(9, 3)], R=[(1, 0), (5, 8)]))
+    board.make_move((5, 8), (0, 8))
+    assert board.is_in_check() and board.is_game_over() and board.is_red_win(), "checkmate not detected"
+
+    # 困毙：黑方没被将军但无棋可走
+    board = Board(empty_rows(k=[(0, 4)], K=[(9, 3)], R=[(1, 0), (2, 6)]))
+    board.make_move((2, 6), (2, 5))
+    assert not board.is_in_check() and board.is_game_over() and board.is_red_win(), "stalemate not detected"
+
+    # 同一局面出现 3 次判和，撤销后恢复
+    board = Board()
+    undo_stack = []
+    for _ in range(2):
+        for src, dst in [((9, 1), (7, 2)), ((0, 1), (2, 2)), ((7, 2), (9, 1)), ((2, 2), (0, 1))]:
+            assert not board.is_game_over(), "game ended before the third repetition"
+            key = board.table_key_after_move(src, dst)
+            undo_stack.append(board.make_move(src, dst))
+            assert key == board.table_key(), "table_key_after_move differs from table_key"
+    assert board.is_repetition() and board.is_draw(), "repetition not detected"
+    # 重复过的局面是否判和取决于走子顺序，不进置换表
+    assert board.table_key() is None, "repeated position got a transposition key"
+    for undo in reversed(undo_stack):
+        board.unmake_move(undo)
+    assert not board.is_game_over() and board._history == [board.zobrist_hash()], "unmake_move did not restore history"
+
+
+if __name__ == '__main__':
+    test_make_unmake()
+    test_zobrist_hash()
+    test_check_and_terminal()
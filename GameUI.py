@@ -3,12 +3,18 @@ import tkinter
 from tkinter import messagebox
 from pygame.locals import *
 from Board import Board
-from mcts import TreeNode
 from mcts import Mcts
+from mcts import SearchSession
 
 
 class GameUI(object):
-    def __init__(self):
+    def __init__(self, time_limit=3.0, rollout_weight=None, dump_tree=False):
+        # 电脑每步的思考时间（秒），领先已无法被追上时提前落子
+        self.__time_limit = time_limit
+        # 叶子价值中 rollout 的权重，None 时按是否有训练好的检查点决定，见 Mcts.search
+        self.__rollout_weight = rollout_weight
+        # 为 True 时每步把整棵搜索树追加写入 mcst_result.txt，限时搜索的树很大，只在调试时打开
+        self.__dump_tree = dump_tree
         pygame.init()
         pygame.display.set_caption("cchess")
         self.__screen = pygame.display.set_mode((720, 800), 0, 32)
@@ -29,6 +35,7 @@ class GameUI(object):
 
     def run(self):
         board = Board()
+        session = SearchSession(board, rollout_weight=self.__rollout_weight)
         is_piece_picked = False
         piece_src_position = None
 
@@ -59,23 +66,27 @@ class GameUI(object):
                                 break
 
                             board = board.move(src, dst)
+                            session.advance((src, dst))
                             is_piece_picked = False
                             self.refresh_board(board)
 
                             if board.is_game_over():
                                 game_over(board)
                                 board = Board()
+                                session.reset(board)
                                 break
 
-                            node = TreeNode.start_node(board)
-                            src, dst = Mcts.search(node, 100)
-                            Mcts.draw_search_tree(node)
+                            src, dst = session.search(time_limit=self.__time_limit, early_stop=True)
+                            if self.__dump_tree:
+                                Mcts.draw_search_tree(session.root)
 
                             board = board.move(src, dst)
+                            session.advance((src, dst))
                             self.refresh_board(board)
                             if board.is_game_over():
                                 game_over(board)
                                 board = Board()
+                                session.reset(board)
 
                 if event.type == QUIT:
                     print("get an quit event.")
@@ -94,7 +105,7 @@ class GameUI(object):
 
 def get_piece_by_position(board, button_up_pos):
     row, col = to_board_pos(button_up_pos)
-    return board.board[row][col]
+    return board.piece_at(row, col)
 
 
 def to_board_pos(pos):
@@ -105,7 +116,7 @@ def to_board_pos(pos):
 def is_same_side(board, src, dst):
     src_row, src_col = src
     dst_row, dst_col = dst
-    return board.board[src_row][src_col].islower() == board.board[dst_row][dst_col]
+    return board.piece_at(src_row, src_col).islower() == board.piece_at(dst_row, dst_col)
 
 
 def show_message_box(title, message):
@@ -118,7 +129,7 @@ def show_message_box(title, message):
 def game_over(board):
     if board.is_draw():
         show_message_box('游戏结束', '和棋')
-    if board.is_red_win():
+    elif board.is_red_win():
         show_message_box('游戏结束', '红棋胜利')
     else:
         show_message_box('游戏结束', '黑棋胜利')
@@ -0,0 +1,28 @@
+import time
+
+from Board import Board
+from mcts import Mcts, TreeNode
+
+
+def run(batch_sizes=(1, 2, 4, 8, 16, 32, 64), search_numbers=256, virtual_loss=1):
+    # 在开局局面上用不同 batch_size 搜索，统计每秒模拟次数
+    results = []
+    for batch_size in batch_sizes:
+        root = TreeNode.start_node(Board())
+        start = time.perf_counter()
+        Mcts.search(root, search_numbers, batch_size=batch_size, virtual_loss=virtual_loss, verbose=0,
+                    rollout_weight=.0)
+        elapsed = time.perf_counter() - start
+        results.append({
+            'batch_size': batch_size,
+            'simulations': search_numbers,
+            'seconds': elapsed,
+            'simulations_per_second': search_numbers / elapsed,
+        })
+    return results
+
+
+if __name__ == '__main__':
+    for result in run():
+        print('batch_size {batch_size:>3}: {simulations_per_second:8.1f} simulations/s '
+              '({simulations} in {seconds:.2f}s)'.format(**result))
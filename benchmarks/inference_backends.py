@@ -0,0 +1,37 @@
+import numpy as np
+
+from inference import BACKENDS, KerasBackend, check_parity, measure_latency
+from net import load_model
+
+
+def run(backends=tuple(BACKENDS), batch_sizes=(1, 2, 4, 8, 16, 32, 64, 128, 256), repeats=20):
+    # 每个后端先与 Keras 对比数值，再测各批大小的单次调用延迟；缺少依赖的后端跳过
+    model = load_model()
+    reference = KerasBackend(model)
+    tensors = np.random.default_rng(0).choice([-1.0, 0.0, 1.0], size=(16, 10, 9, 9)).astype(np.float32)
+
+    results = []
+    for name in backends:
+        try:
+            backend = BACKENDS[name](model)
+        except ImportError as e:
+            print(f"skip {name}: {e}")
+            continue
+        policy_error, value_error = check_parity(backend, reference, tensors)
+        for batch_size in batch_sizes:
+            latency = measure_latency(backend, batch_size, repeats)
+            results.append({
+                'backend': name,
+                'batch_size': batch_size,
+                'latency_ms': latency * 1000,
+                'positions_per_second': batch_size / latency,
+                'policy_error': policy_error,
+                'value_error': value_error,
+            })
+    return results
+
+
+if __name__ == '__main__':
+    for result in run():
+        print('{backend:<7} batch {batch_size:>3}: {latency_ms:9.2f} ms, {positions_per_second:9.1f} positions/s '
+              '(max error policy {policy_error:.1e}, value {value_error:.1e})'.format(**result))
@@ -0,0 +1,55 @@
+import time
+import tracemalloc
+
+import numpy as np
+
+from Board import Board
+from mcts import Mcts, TreeNode
+from node_store import ArrayTree
+from uci import uci_labels
+
+
+def uniform_predict(tensors, **kwargs):
+    # 均匀先验、零价值，只测树本身的开销，不受网络速度影响
+    count = len(tensors)
+    return np.zeros((count, len(uci_labels)), dtype=np.float32), np.zeros((count, 1), dtype=np.float32)
+
+
+def count_nodes(root):
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.get_children())
+    return count
+
+
+def run(search_numbers=2000, batch_size=8):
+    # 同样的模拟次数下比较两种后端的每节点字节数与每秒新建节点数
+    results = []
+    for backend in ('TreeNode', 'ArrayTree'):
+        tracemalloc.start()
+        start = time.perf_counter()
+        root = TreeNode.start_node(Board()) if backend == 'TreeNode' else ArrayTree(Board())
+        Mcts.search(root, search_numbers, batch_size=batch_size, predict=uniform_predict, verbose=0)
+        elapsed = time.perf_counter() - start
+        allocated, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        nodes = count_nodes(root) if backend == 'TreeNode' else len(root)
+        results.append({
+            'backend': backend,
+            'simulations': search_numbers,
+            'nodes': nodes,
+            'bytes_per_node': allocated / nodes,
+            'nodes_per_second': nodes / elapsed,
+            'simulations_per_second': search_numbers / elapsed,
+        })
+    return results
+
+
+if __name__ == '__main__':
+    for result in run():
+        print('{backend:<9}: {nodes:>7} nodes, {bytes_per_node:8.1f} bytes/node, {nodes_per_second:9.1f} nodes/s, '
+              '{simulations_per_second:7.1f} simulations/s'.format(**result))
@@ -0,0 +1,44 @@
+import time
+
+from Board import Board
+from mcts import TreeNode
+from parallel import ParallelSearch
+
+
+def search_once(search, mode, search_numbers):
+    if mode == 'root_parallel':
+        search.root_parallel(Board(), search_numbers, seed=0, verbose=0, rollout_weight=.0)
+    else:
+        search.leaf_parallel(TreeNode.start_node(Board()), search_numbers, verbose=0)
+
+
+def run(workers_list=(1, 2, 4, 8), search_numbers=512, warm_up_numbers=64):
+    # 固定总模拟次数，比较不同进程数下 root/leaf 并行的每秒模拟次数
+    # 计时前先预热进程池（启动进程、加载模型），再各跑一次不计时的短搜索，让各批次大小的第一次 predict 也不计入
+    results = []
+    for workers in workers_list:
+        with ParallelSearch(workers) as search:
+            search.warm_up()
+            for mode in ('root_parallel', 'leaf_parallel'):
+                search_once(search, mode, warm_up_numbers)
+                start = time.perf_counter()
+                search_once(search, mode, search_numbers)
+                elapsed = time.perf_counter() - start
+                results.append({
+                    'mode': mode,
+                    'workers': workers,
+                    'simulations': search_numbers,
+                    'seconds': elapsed,
+                    'simulations_per_second': search_numbers / elapsed,
+                })
+
+    for result in results:
+        baseline = next(r for r in results if r['mode'] == result['mode'] and r['workers'] == workers_list[0])
+        result['speedup'] = result['simulations_per_second'] / baseline['simulations_per_second']
+    return results
+
+
+if __name__ == '__main__':
+    for result in run():
+        print('{mode:<14} workers {workers:>2}: {simulations_per_second:8.1f} simulations/s, '
+              'speedup {speedup:.2f}x'.format(**result))
@@ -0,0 +1,64 @@
+import time
+
+from Board import Board
+
+# (名称, 从开局起的走法, 各深度的节点数)
+# legal_moves() 过滤送将和将帅对脸，开局各层与标准规则的 44 / 1920 / 79666 一致
+POSITIONS = [
+    ('initial', [], [44, 1920, 79666]),
+    ('central cannon', [((7, 7), (7, 4)), ((0, 7), (2, 6)), ((9, 7), (7, 6)), ((0, 8), (0, 7))],
+     [34, 1307, 45366]),
+    ('pinned cannon', [((7, 1), (7, 4)), ((2, 7), (2, 4)), ((7, 4), (3, 4)), ((0, 3), (1, 4)), ((7, 7), (7, 4))],
+     [25, 845, 23045]),
+]
+
+
+def perft(board: Board, depth):
+    # 原地走子 / 撤销，统计 depth 层的叶子数；终局局面不再展开
+    if depth == 0:
+        return 1
+    if board.is_game_over():
+        return 0
+    nodes = 0
+    for src, dst in list(board.legal_moves()):
+        undo = board.make_move(src, dst)
+        nodes += perft(board, depth - 1)
+        board.unmake_move(undo)
+    return nodes
+
+
+def start_position(moves):
+    board = Board()
+    for src, dst in moves:
+        if not board.is_valid_move(src, dst):
+            raise Exception(f"invalid move {src} -> {dst} in perft position.")
+        board.make_move(src, dst)
+    return board
+
+
+def run(positions=POSITIONS, max_depth=3):
+    # 每个局面逐层计数并与已知节点数比较，mismatch 不为空说明走法生成出错
+    results = []
+    for name, moves, expected in positions:
+        board = start_position(moves)
+        for depth in range(1, max_depth + 1):
+            start = time.perf_counter()
+            nodes = perft(board, depth)
+            elapsed = time.perf_counter() - start
+            known = expected[depth - 1] if depth <= len(expected) else None
+            results.append({
+                'position': name,
+                'depth': depth,
+                'nodes': nodes,
+                'expected': known,
+                'ok': known is None or nodes == known,
+                'seconds': elapsed,
+                'nodes_per_second': nodes / elapsed,
+            })
+    return results
+
+
+if __name__ == '__main__':
+    for result in run():
+        print('{position:<16} depth {depth}: {nodes:>8} nodes (expected {expected}), {nodes_per_second:9.1f} nodes/s'
+              .format(**result) + ('' if result['ok'] else '  MISMATCH'))
@@ -0,0 +1,49 @@
+import argparse
+
+from inference import KerasBackend, TFLiteBackend, measure_latency
+from net import load_model
+from quantize import compare, quantize_model, replay_positions, sample_positions
+
+# (名称, 网络结构)；slim 版本需要各自训练的检查点，否则与完整网络的一致率没有意义，
+# 例如 train.py --num-filters 128 --num-blocks 5 --checkpoint-dir checkpoints/128x5，再用 --weights 128x5=... 传入
+VARIANTS = [
+    ('full', {}),
+    ('128x5', {'num_filters': 128, 'num_blocks': 5}),
+    ('64x3', {'num_filters': 64, 'num_blocks': 3, 'value_hidden': 128}),
+]
+
+
+def run(weights=None, replay=None, batch_sizes=(1, 16, 64), positions=256, repeats=10):
+    # 以完整精度的完整网络为基准，比较各网络结构在 float32 与 int8 下的延迟、大小和输出一致率
+    weights = weights or {}
+    tensors, moves = sample_positions(positions)
+    calibration = replay_positions(replay) if replay else tensors
+    full = load_model()
+    reference = KerasBackend(full)
+
+    results = []
+    for name, options in VARIANTS:
+        model = load_model(weights.get(name), **options) if options else full
+        for precision in ('float32', 'int8'):
+            content = quantize_model(model, calibration, int8=precision == 'int8')
+            backend = TFLiteBackend(model_content=content)
+            result = {'model': name, 'precision': precision, 'size_mb': len(content) / 2 ** 20,
+                      'params': model.count_params()}
+            result.update(compare(backend, reference, tensors, moves))
+            for batch_size in batch_sizes:
+                result[f'latency_ms_b{batch_size}'] = measure_latency(backend, batch_size, repeats) * 1000
+            results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='latency / size / agreement report for slim and int8 networks')
+    parser.add_argument('--replay', default=None, help='replay buffer used as the int8 calibration set')
+    parser.add_argument('--weights', nargs='*', default=[], help='name=path checkpoints for the slim variants')
+    args = parser.parse_args()
+
+    for result in run(dict(item.split('=', 1) for item in args.weights), args.replay):
+        latency = ', '.join(f'b{key[12:]} {value:.2f}ms' for key, value in result.items()
+                            if key.startswith('latency_ms_b'))
+        print('{model:<6} {precision:<7} {size_mb:7.2f} MB, top-1 {policy_top1_agreement:.1%}, '
+              'value mae {value_mae:.3f}, sign {value_sign_agreement:.1%}, '.format(**result) + latency)
@@ -0,0 +1,152 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+from Board import Board
+from benchmarks import perft
+from encoder import Position, encode_batch, to_tensor
+from inference import create_backend, measure_latency
+from mcts import Mcts, TreeNode
+from rollout import measure_rollouts
+
+BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+# 默认允许 10% 的波动，超过视为性能回退
+THRESHOLD = 0.1
+
+
+def random_positions(count=1024, seed=0, max_moves=120):
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board, last_step = Board(), None
+        for _ in range(rng.randrange(max_moves)):
+            if board.is_game_over() or len(positions) == count:
+                break
+            positions.append(Position(board, last_step))
+            last_step = rng.choice(list(board.legal_moves()))
+            board = board.apply_move(*last_step)
+    return positions
+
+
+def metric(value, unit, higher_is_better=True):
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def bench_perft(max_depth=3):
+    metrics = {}
+    results = perft.run(max_depth=max_depth)
+    nodes = sum(result['nodes'] for result in results)
+    seconds = sum(result['seconds'] for result in results)
+    metrics['perft.nodes_per_second'] = metric(nodes / seconds, 'nodes/s')
+    return metrics, results
+
+
+def bench_encoder(count=1024, batch_size=256):
+    positions = random_positions(count)
+    start = time.perf_counter()
+    for position in positions:
+        to_tensor(position)
+    single = count / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(0, count, batch_size):
+        encode_batch(positions[i:i + batch_size])
+    batched = count / (time.perf_counter() - start)
+    return {
+        'to_tensor.positions_per_second': metric(single, 'positions/s'),
+        'encode_batch.positions_per_second': metric(batched, 'positions/s'),
+    }
+
+
+def bench_rollout(count=200):
+    return {'rollout.rollouts_per_second': metric(measure_rollouts(count=count)['rollouts_per_second'], 'rollouts/s')}
+
+
+def bench_predict(backend, batch_sizes=BATCH_SIZES, repeats=20):
+    return {f'predict.latency_ms.b{batch_size}': metric(measure_latency(backend, batch_size, repeats) * 1000, 'ms',
+                                                         higher_is_better=False)
+            for batch_size in batch_sizes}
+
+
+def bench_search(backend, search_numbers=200, batch_sizes=(1, 16)):
+    metrics = {}
+    for batch_size in batch_sizes:
+        random.seed(0)
+        root = TreeNode.start_node(Board())
+        start = time.perf_counter()
+        Mcts.search(root, search_numbers, batch_size=batch_size, predict=backend.predict, verbose=0)
+        elapsed = time.perf_counter() - start
+        metrics[f'search.simulations_per_second.b{batch_size}'] = metric(search_numbers / elapsed, 'simulations/s')
+    return metrics
+
+
+def run(backend=None, perft_depth=3, batch_sizes=BATCH_SIZES, repeats=20, search_numbers=200):
+    """跑全部基准，返回可以直接 json.dump 的结果；backend 默认按环境变量创建。"""
+    backend = create_backend() if backend is None else backend
+    metrics, perft_results = bench_perft(perft_depth)
+    metrics.update(bench_encoder())
+    metrics.update(bench_rollout())
+    metrics.update(bench_predict(backend, batch_sizes, repeats))
+    metrics.update(bench_search(backend, search_numbers))
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'backend': backend.name,
+        },
+        'perft': perft_results,
+        'metrics': metrics,
+    }
+
+
+def compare(results, baseline, threshold=THRESHOLD, thresholds=None):
+    """与基线比较，返回变差超过阈值的指标；thresholds 可按指标名单独指定阈值。"""
+    regressions = []
+    for name, current in results['metrics'].items():
+        if name not in baseline['metrics']:
+            continue
+        previous = baseline['metrics'][name]['value']
+        limit = (thresholds or {}).get(name, threshold)
+        if current['higher_is_better']:
+            change = (previous - current['value']) / previous
+        else:
+            change = (current['value'] - previous) / previous
+        if change > limit:
+            regressions.append({'metric': name, 'baseline': previous, 'value': current['value'], 'change': change,
+                                'threshold': limit})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='perft / encoder / inference / search benchmarks with baseline check')
+    parser.add_argument('--out', default=None, help='write results as JSON')
+    parser.add_argument('--baseline', default=None, help='JSON from an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='allowed relative regression')
+    parser.add_argument('--perft-depth', type=int, default=3)
+    parser.add_argument('--search-numbers', type=int, default=200)
+    args = parser.parse_args()
+
+    results = run(perft_depth=args.perft_depth, search_numbers=args.search_numbers)
+    for name, item in results['metrics'].items():
+        print(f"{name:<40} {item['value']:12.2f} {item['unit']}")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    failed = False
+    for result in results['perft']:
+        if not result['ok']:
+            failed = True
+            print('perft mismatch: {position} depth {depth}: {nodes} != {expected}'.format(**result))
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for regression in compare(results, baseline, args.threshold):
+            failed = True
+            print('regression: {metric} {baseline:.2f} -> {value:.2f} ({change:+.1%}, threshold {threshold:.0%})'
+                  .format(**regression))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,82 @@
+from collections import namedtuple
+
+import numpy as np
+
+from Board import Board, BLACK, COLS, NUM_SQUARES, PIECE_CHARS
+
+PLANES = 9
+
+# 不依赖 TreeNode 的局面 + 上一步，可以直接交给 encode_batch() 和 evalcache.position_key()
+Position = namedtuple('Position', ['board', 'move'])
+
+# 棋子编码 -> 7 个棋子平面（车马相仕帅炮兵），红方为 1，黑方为 -1
+PIECE_PLANES = np.zeros((len(PIECE_CHARS), 7), dtype=np.int8)
+for _code in range(len(PIECE_CHARS)):
+    if _code & 7:
+        PIECE_PLANES[_code, (_code & 7) - 1] = -1 if _code & BLACK else 1
+
+
+def _unpack(item):
+    # 接受 TreeNode（取 board 与 move）或单独的 Board（没有上一步）
+    if isinstance(item, Board):
+        return item, None
+    return item.board, item.move
+
+
+def encode_batch(items, out=None, dtype=np.float32):
+    """把一组节点或局面编码成 (N, 10, 9, 9) 张量，out 给定时原地写入并返回 out[:N]。"""
+    count = len(items)
+    if out is None:
+        out = np.empty((count, 10, 9, PLANES), dtype=dtype)
+    tensor = out[:count]
+
+    boards = [_unpack(item) for item in items]
+    codes = np.frombuffer(b''.join(board.squares for board, _ in boards), dtype=np.uint8)
+    tensor[:, :, :, :7] = PIECE_PLANES[codes].reshape(count, 10, 9, 7)
+    tensor[:, :, :, 7:] = 0
+
+    for i, (board, last_step) in enumerate(boards):
+        if last_step is not None:
+            source, target = last_step
+            if source is not None and target is not None:
+                tensor[i, source[0], source[1], 7] = -1
+                tensor[i, target[0], target[1], 7] = 1
+        if board.is_red_turn():
+            tensor[i, :, :, 8] = 1
+
+    return tensor
+
+
+def to_tensor(item, dtype=np.float32):
+    return encode_batch([item], dtype=dtype)[0]
+
+
+def test_encode_batch():
+    import random
+
+    board = Board()
+    items = [board]
+    for _ in range(20):
+        src, dst = random.choice(list(board.legal_moves()))
+        board = board.apply_move(src, dst)
+        items.append(Position(board, (src, dst)))
+
+    out = np.full((32, 10, 9, PLANES), 7, dtype=np.float64)
+    batch = encode_batch(items, out=out, dtype=np.float64)
+    assert batch.shape == (len(items), 10, 9, PLANES), "wrong batch shape"
+    for i, item in enumerate(items):
+        assert np.array_equal(batch[i], to_tensor(item)), "batch and single encodings differ"
+        node_board, last_step = _unpack(item)
+        for square in range(NUM_SQUARES):
+            x, y = divmod(square, COLS)
+            piece = node_board.piece_at(x, y)
+            plane = batch[i, x, y, :7]
+            if piece == '_':
+                assert not plane.any(), "empty square has a piece plane set"
+            else:
+                assert plane['RNBAKCP'.index(piece.upper())] == (1 if piece.isupper() else -1), "wrong piece plane"
+        assert (batch[i, :, :, 8] == (1 if node_board.is_red_turn() else 0)).all(), "wrong turn plane"
+
+
+if __name__ == '__main__':
+    test_encode_batch()
@@ -0,0 +1,128 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+def position_key(node):
+    # 局面哈希 + 上一步（to_tensor 会编码上一步，所以它也属于网络输入的一部分）
+    # node 为 TreeNode 或 encoder.Position
+    position_hash = node.board.zobrist_hash()
+    last_step = node.move
+    if last_step is None or last_step[0] is None or last_step[1] is None:
+        return position_hash, -1
+    (sx, sy), (dx, dy) = last_step
+    return position_hash, (sx * 9 + sy) * 90 + dx * 9 + dy
+
+
+def npz_path(path):
+    # np.savez_compressed 会给没有 .npz 后缀的文件名补上后缀，读写两边统一补齐
+    path = str(path)
+    return path if path.endswith('.npz') else path + '.npz'
+
+
+class EvaluationCache:
+    """网络评估结果缓存：position_key -> (policy, value)，超过条目或字节上限时按 LRU 淘汰。"""
+
+    def __init__(self, max_entries=100000, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, policy, value):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[0].nbytes
+        policy = np.array(policy, dtype=np.float32)
+        self.entries[key] = (policy, float(value))
+        self.bytes += policy.nbytes
+        while len(self.entries) > self.max_entries or \
+                (self.max_bytes is not None and self.bytes > self.max_bytes and len(self.entries) > 1):
+            _, (evicted, _) = self.entries.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+        }
+
+    def save(self, path):
+        # 按 LRU 顺序保存，加载时越新的条目越晚插入；返回实际写入的文件名
+        path = npz_path(path)
+        keys = list(self.entries.keys())
+        np.savez_compressed(
+            path,
+            hashes=np.array([position_hash for position_hash, _ in keys], dtype=np.uint64),
+            moves=np.array([move for _, move in keys], dtype=np.int32),
+            policies=np.stack([policy for policy, _ in self.entries.values()]) if keys else np.zeros((0, 2086),
+                                                                                                    np.float32),
+            values=np.array([value for _, value in self.entries.values()], dtype=np.float32),
+        )
+        return path
+
+    def warm(self, path):
+        with np.load(npz_path(path)) as data:
+            for position_hash, move, policy, value in zip(data['hashes'], data['moves'], data['policies'],
+                                                          data['values']):
+                self.put((int(position_hash), int(move)), policy, value)
+        return self
+
+    @staticmethod
+    def load(path, max_entries=100000, max_bytes=None):
+        return EvaluationCache(max_entries, max_bytes).warm(path)
+
+
+def test_save_load():
+    import os
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    cache = EvaluationCache(max_entries=8)
+    for i in range(10):
+        cache.put((int(rng.integers(2 ** 63)) + 2 ** 63, i - 1), rng.random(2086), rng.random() * 2 - 1)
+    # 访问一个旧条目，让 LRU 顺序不同于插入顺序
+    cache.get(next(iter(cache.entries)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = cache.save(os.path.join(directory, 'cache'))
+        assert path.endswith('.npz') and os.path.exists(path), "save did not add .npz suffix"
+        loaded = EvaluationCache.load(os.path.join(directory, 'cache'), max_entries=8)
+        # 容量更小的缓存从文件预热时，保留的是最近使用的条目
+        small = EvaluationCache.load(path, max_entries=3)
+
+    assert list(loaded.entries) == list(cache.entries), "keys or LRU order differ after round trip"
+    for key, (policy, value) in cache.entries.items():
+        loaded_policy, loaded_value = loaded.entries[key]
+        assert np.array_equal(loaded_policy, policy), "policy differs after round trip"
+        assert loaded_value == np.float32(value), "value differs after round trip"
+    assert loaded.bytes == cache.bytes
+    assert list(small.entries) == list(cache.entries)[-3:], "warm did not keep the most recent entries"
@@ -0,0 +1,190 @@
+import os
+import time
+
+import numpy as np
+
+from net import load_model
+
+# 通过环境变量选择推理后端：keras / numpy / tflite / onnx
+BACKEND_ENV = 'ALPHACHESS_INFERENCE_BACKEND'
+# tflite 后端可直接加载 quantize.py 导出的模型文件（例如 int8 量化模型）
+TFLITE_MODEL_ENV = 'ALPHACHESS_TFLITE_MODEL'
+
+
+class KerasBackend:
+    """直接调用 Keras 模型；predict_on_batch 比 predict 少了每次调用的数据管道开销。"""
+
+    name = 'keras'
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict(self, tensors, **kwargs):
+        policy, value = self.model.predict_on_batch(np.asarray(tensors, dtype=np.float32))
+        return np.asarray(policy), np.asarray(value)
+
+
+def _fold_batch_norm(conv, batch_norm):
+    # 把 BatchNormalization 折叠进前面卷积的权重和偏置
+    kernel, bias = conv.get_weights()
+    gamma, beta, mean, variance = batch_norm.get_weights()
+    scale = gamma / np.sqrt(variance + batch_norm.epsilon)
+    return (kernel * scale).astype(np.float32), ((bias - mean) * scale + beta).astype(np.float32)
+
+
+def _conv3x3(x, kernel, bias):
+    # same padding 的 3x3 卷积：把 9 个平移拼成 im2col 矩阵后做一次矩阵乘
+    rows, cols = x.shape[1], x.shape[2]
+    padded = np.pad(x, ((0, 0), (1, 1), (1, 1), (0, 0)))
+    patches = np.concatenate([padded[:, i:i + rows, j:j + cols, :] for i in range(3) for j in range(3)], axis=-1)
+    return patches @ kernel.reshape(-1, kernel.shape[-1]) + bias
+
+
+def _conv1x1(x, kernel, bias):
+    return x @ kernel.reshape(kernel.shape[-2], kernel.shape[-1]) + bias
+
+
+class NumpyBackend:
+    """纯 NumPy 前向计算，BatchNormalization 已折叠进卷积权重，不依赖 TensorFlow 运行时。"""
+
+    name = 'numpy'
+
+    def __init__(self, model):
+        layers = {layer.name: layer for layer in model.layers}
+        self.stem = _fold_batch_norm(layers['stem_conv'], layers['stem_bn'])
+        self.blocks = []
+        while f'res{len(self.blocks)}_conv1' in layers:
+            i = len(self.blocks)
+            self.blocks.append((_fold_batch_norm(layers[f'res{i}_conv1'], layers[f'res{i}_bn1']),
+                                _fold_batch_norm(layers[f'res{i}_conv2'], layers[f'res{i}_bn2'])))
+        self.policy_conv = _fold_batch_norm(layers['policy_conv'], layers['policy_bn'])
+        self.policy_dense = [w.astype(np.float32) for w in layers['policy_dense'].get_weights()]
+        self.value_conv = _fold_batch_norm(layers['value_conv'], layers['value_bn'])
+        self.value_dense1 = [w.astype(np.float32) for w in layers['value_dense1'].get_weights()]
+        self.value_dense2 = [w.astype(np.float32) for w in layers['value_dense2'].get_weights()]
+
+    def predict(self, tensors, **kwargs):
+        x = np.asarray(tensors, dtype=np.float32)
+        count = len(x)
+
+        x = np.maximum(_conv3x3(x, *self.stem), 0)
+        for first, second in self.blocks:
+            y = np.maximum(_conv3x3(x, *first), 0)
+            x = np.maximum(x + _conv3x3(y, *second), 0)
+
+        policy = np.maximum(_conv1x1(x, *self.policy_conv), 0).reshape(count, -1)
+        policy = policy @ self.policy_dense[0] + self.policy_dense[1]
+
+        value = np.maximum(_conv1x1(x, *self.value_conv), 0).reshape(count, -1)
+        value = np.maximum(value @ self.value_dense1[0] + self.value_dense1[1], 0)
+        value = np.tanh(value @ self.value_dense2[0] + self.value_dense2[1])
+        return policy, value
+
+
+class TFLiteBackend:
+    """把 Keras 模型转换成 TFLite 后在 CPU 上运行，批大小变化时重新分配张量。"""
+
+    name = 'tflite'
+
+    def __init__(self, model=None, model_content=None):
+        import tensorflow as tf
+
+        if model_content is None:
+            model_content = tf.lite.TFLiteConverter.from_keras_model(model).convert()
+        self.model_content = model_content
+        self.interpreter = tf.lite.Interpreter(model_content=model_content, num_threads=os.cpu_count())
+        self.input = self.interpreter.get_input_details()[0]
+        outputs = self.interpreter.get_output_details()
+        # 按输出宽度区分策略头与价值头
+        self.policy_output, self.value_output = sorted(outputs, key=lambda output: -output['shape'][-1])
+        self.batch_size = None
+
+    def predict(self, tensors, **kwargs):
+        x = np.asarray(tensors, dtype=np.float32)
+        if len(x) != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input['index'], x.shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = len(x)
+        self.interpreter.set_tensor(self.input['index'], self.__quantize(x))
+        self.interpreter.invoke()
+        return (self.__dequantize(self.policy_output, self.interpreter.get_tensor(self.policy_output['index'])),
+                self.__dequantize(self.value_output, self.interpreter.get_tensor(self.value_output['index'])))
+
+    def __quantize(self, x):
+        scale, zero_point = self.input['quantization']
+        if self.input['dtype'] == np.float32 or scale == 0:
+            return x
+        return np.round(x / scale + zero_point).astype(self.input['dtype'])
+
+    @staticmethod
+    def __dequantize(output, y):
+        scale, zero_point = output['quantization']
+        if output['dtype'] == np.float32 or scale == 0:
+            return y
+        return (y.astype(np.float32) - zero_point) * scale
+
+
+class OnnxBackend:
+    """通过 tf2onnx 导出后用 ONNX Runtime 的 CPU 执行器运行。"""
+
+    name = 'onnx'
+
+    def __init__(self, model):
+        import onnxruntime
+        import tensorflow as tf
+        import tf2onnx
+
+        signature = [tf.TensorSpec((None, 10, 9, 9), tf.float32, name='input')]
+        onnx_model, _ = tf2onnx.convert.from_keras(model, input_signature=signature)
+        self.session = onnxruntime.InferenceSession(onnx_model.SerializeToString(),
+                                                    providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_names = [output.name for output in self.session.get_outputs()]
+
+    def predict(self, tensors, **kwargs):
+        outputs = self.session.run(self.output_names, {self.input_name: np.asarray(tensors, dtype=np.float32)})
+        policy, value = sorted(outputs, key=lambda output: -output.shape[-1])
+        return policy, value
+
+
+BACKENDS = {
+    'keras': KerasBackend,
+    'numpy': NumpyBackend,
+    'tflite': TFLiteBackend,
+    'onnx': OnnxBackend,
+}
+
+
+def create_backend(name=None, model=None):
+    # name 默认读环境变量 ALPHACHESS_INFERENCE_BACKEND，未设置时用 keras
+    # 模型默认用 load_model() 加载的 latest 检查点，网络结构按检查点旁保存的 architecture.json 决定
+    if name is None:
+        name = os.environ.get(BACKEND_ENV, 'keras')
+    if name not in BACKENDS:
+        raise ValueError(f"unknown inference backend: {name}")
+    if name == 'tflite' and model is None and os.environ.get(TFLITE_MODEL_ENV):
+        with open(os.environ[TFLITE_MODEL_ENV], 'rb') as f:
+            return TFLiteBackend(model_content=f.read())
+    return BACKENDS[name](load_model() if model is None else model)
+
+
+def check_parity(backend, reference, tensors, atol=1e-3):
+    """与参考后端比较输出，返回策略与价值的最大绝对误差；超过 atol 时抛出异常。"""
+    policy, value = backend.predict(tensors)
+    expected_policy, expected_value = reference.predict(tensors)
+    policy_error = float(np.max(np.abs(policy - expected_policy)))
+    value_error = float(np.max(np.abs(value - expected_value)))
+    if policy_error > atol or value_error > atol:
+        raise Exception(f"{backend.name} differs from {reference.name}: "
+                        f"policy {policy_error:.2e}, value {value_error:.2e}")
+    return policy_error, value_error
+
+
+def measure_latency(backend, batch_size, repeats=20, warmup=3):
+    tensors = np.random.default_rng(0).choice([-1.0, 0.0, 1.0], size=(batch_size, 10, 9, 9)).astype(np.float32)
+    for _ in range(warmup):
+        backend.predict(tensors)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        backend.predict(tensors)
+    return (time.perf_counter() - start) / repeats
@@ -0,0 +1,117 @@
+import multiprocessing
+import queue
+import time
+import traceback
+
+import numpy as np
+
+from inference import create_backend
+
+
+class InferenceError(Exception):
+    """服务进程里加载模型或 predict 出错，客户端 predict() 抛出，消息为服务端的 traceback。"""
+
+
+def _serve(model_factory, requests, responses, max_batch_size, max_wait_us):
+    # 出错时不退出服务进程，把错误发给这一批的客户端，否则它们会一直等在 responses.get() 上
+    model, load_error = None, None
+    try:
+        model = model_factory()
+    except Exception:
+        load_error = InferenceError(traceback.format_exc())
+    max_wait = max_wait_us / 1e6
+    running = True
+
+    while running:
+        item = requests.get()
+        if item is None:
+            break
+
+        # 收到第一个请求后，最多再等 max_wait_us 微秒凑批，凑满 max_batch_size 个局面立即评估
+        batch = [item]
+        size = len(item[1])
+        deadline = time.perf_counter() + max_wait
+        while size < max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                running = False
+                break
+            batch.append(item)
+            size += len(item[1])
+
+        error = load_error
+        if error is None:
+            try:
+                policy_preds, value_preds = model.predict(np.concatenate([tensors for _, tensors in batch]))
+            except Exception:
+                error = InferenceError(traceback.format_exc())
+        if error is not None:
+            for client_id, _ in batch:
+                responses[client_id].put(error)
+            continue
+
+        offset = 0
+        for client_id, tensors in batch:
+            end = offset + len(tensors)
+            responses[client_id].put((policy_preds[offset:end], value_preds[offset:end]))
+            offset = end
+
+
+class InferenceClient:
+    """推理服务的客户端，predict() 与 model.predict 接口相同，可直接交给 mcts.set_model()。"""
+
+    def __init__(self, client_id, requests, responses):
+        self.client_id = client_id
+        self.requests = requests
+        self.responses = responses
+
+    def predict(self, tensors, **kwargs):
+        self.requests.put((self.client_id, np.asarray(tensors)))
+        response = self.responses.get()
+        if isinstance(response, InferenceError):
+            raise response
+        return response
+
+    __call__ = predict
+
+
+class InferenceServer:
+    """由一个进程持有模型，搜索进程通过队列提交编码后的局面，服务端动态凑批后统一评估。
+
+    客户端数量需要在启动前确定：队列只能在创建子进程时继承，所以每个客户端的应答队列都预先建好，
+    通过 Process / ProcessPoolExecutor 的参数传给搜索进程。
+    """
+
+    def __init__(self, max_clients=8, max_batch_size=64, max_wait_us=500, model_factory=create_backend):
+        context = multiprocessing.get_context()
+        self.requests = context.Queue()
+        self.clients = [InferenceClient(i, self.requests, context.Queue()) for i in range(max_clients)]
+        self.process = context.Process(
+            target=_serve,
+            args=(model_factory, self.requests, [client.responses for client in self.clients],
+                  max_batch_size, max_wait_us),
+            daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self.process.start()
+
+    def stop(self):
+        if self.process.is_alive():
+            self.requests.put(None)
+            self.process.join()
+
+    def client(self, client_id):
+        return self.clients[client_id]
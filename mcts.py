@@ -1,12 +1,21 @@
 import math
+import os
 import random
+import threading
+import time
 
 import numpy as np
 from anytree import Node, RenderTree
 
 from Board import Board
-from net import load_model
-from uci import get_probability
+from encoder import Position, encode_batch, to_tensor
+from evalcache import position_key
+from inference import TFLITE_MODEL_ENV, create_backend
+from net import CHECKPOINT_PATH
+from node_store import ROOT, ArrayTree
+from rollout import rollout as play_rollout
+from telemetry import NULL_TELEMETRY
+from uci import get_priors, uci_labels
 
 
 class TreeNode:
@@ -14,9 +23,16 @@ class TreeNode:
         self.board = board
         self.parent = parent
 
-        self.terminal = board.is_game_over()
+        # 是否终局（将死、困毙、和棋）和合法走法都要生成一遍走法，到选择走到该节点时才计算
+        # moves 在扩展后释放，只留下 num_moves
+        self.terminal = None
+        self.moves = None
+        self.num_moves = None
 
+        self.key = board.zobrist_hash()
         self.childMap = {}
+        # 边上的数据 key -> (move, probability)；启用置换表后同一节点可能挂在多个父节点下
+        self.edges = {}
 
         self.visits = 0
         self.scores = 0
@@ -31,7 +47,16 @@ class TreeNode:
     def get_parent(self):
         return self.parent
 
+    def legal_moves(self):
+        # 合法走法只生成一次，is_terminal、is_fully_expanded 和扩展共用
+        if self.moves is None:
+            self.moves = self.board.legal_move_list()
+            self.num_moves = len(self.moves)
+        return self.moves
+
     def is_terminal(self):
+        if self.terminal is None:
+            self.terminal = self.board.is_game_over()
         return self.terminal
 
     def get_visits(self):
@@ -53,6 +78,16 @@ class TreeNode:
     def child_node(board: Board, parent, move):
         return TreeNode(board, parent, move)
 
+    def add_child(self, node, move, probability=.0):
+        self.childMap[node.key] = node
+        self.edges[node.key] = (move, probability)
+
+    def get_child_move(self, child):
+        return self.edges[child.key][0]
+
+    def get_child_probability(self, child):
+        return self.edges[child.key][1]
+
     def replica(self):
         return TreeNode(self.board.clone(), None, (None, None))
 
@@ -67,37 +102,26 @@ class TreeNode:
         return 'red' if self.board.is_last_red_turn() else 'black'
 
     def terminal_score(self):
-        if not self.board.is_game_over():
-            raise Exception("game is on going.")
-        if self.board.is_draw():
-            return 0
-        if self.board.is_red_win():
-            return 1
-        if self.board.is_black_win():
-            return -1
-
-        raise Exception("error state.")
+        return terminal_score(self.board)
 
     def expand(self):
-        moves = self.board.possible_moves()
-
-        for nest_state, src, dst in moves:
-            if nest_state.encode() not in self.childMap:
-                node = TreeNode.child_node(nest_state, self, (src, dst))
-                self.childMap[nest_state.encode()] = node
+        board = self.board
+        for src, dst in board.legal_moves():
+            key = board.hash_after_move(src, dst)
+            if key not in self.childMap:
+                node = TreeNode.child_node(board.apply_move(src, dst), self, (src, dst))
+                self.add_child(node, (src, dst))
                 return node
         return None
 
     def is_fully_expanded(self):
-        moves = self.board.possible_moves()
-        return len(self.childMap) == len(moves)
+        if self.num_moves is None:
+            self.legal_moves()
+        return len(self.childMap) == self.num_moves
 
     def rollout(self):
-        while not self.board.is_game_over():
-            moves = self.board.possible_moves()
-            next_state, src, dst = random.choice(moves)
-            self.board = next_state
-        return self.terminal_score()
+        # 见 rollout.py：原地走子的轻量策略，到步数上限时按子力评估，结束后局面不变
+        return play_rollout(self.board)
 
     def get_children(self):
         return self.childMap.values()
@@ -106,19 +130,197 @@ class TreeNode:
         return self.board.possible_moves()
 
 
-model = load_model()
+def terminal_score(board: Board):
+    # 终局局面的红方视角得分：红胜 1，黑胜 -1，和棋 0
+    if not board.is_game_over():
+        raise Exception("game is on going.")
+    if board.is_draw():
+        return 0
+    if board.is_red_win():
+        return 1
+    if board.is_black_win():
+        return -1
+
+    raise Exception("error state.")
+
+
+# 模型在第一次评估时才加载；使用推理服务的进程通过 set_model() 换成客户端，不必各自构建网络
+# 推理后端由环境变量 ALPHACHESS_INFERENCE_BACKEND 选择，见 inference.py
+model = None
+
+
+def get_model():
+    global model
+    if model is None:
+        model = create_backend()
+    return model
+
+
+def set_model(new_model):
+    global model
+    model = new_model
+
+
+def has_trained_model():
+    # create_backend() 会加载训练好的权重时为 True：有检查点，或指定了 TFLite 模型文件
+    # 只看文件和环境变量，与本进程是否已调用过 get_model() 无关；set_model() 换上的模型不在此列，
+    # 需要时由调用方显式传 rollout_weight
+    return os.path.exists(CHECKPOINT_PATH) or bool(os.environ.get(TFLITE_MODEL_ENV))
+
+
+# 纯 rollout 评估时用的策略输出，get_priors 会把它变成合法走法上的均匀分布
+UNIFORM_POLICY = np.zeros(len(uci_labels), dtype=np.float32)
+
+
+# TreeNode 的内存无法直接统计，按 benchmarks/node_store.py 测得的每节点字节数（约 820）留余量估算
+TREE_NODE_BYTES = 1024
+
+
+class SearchBudget:
+    """一次搜索的预算：模拟次数、墙钟时间（秒）、新建节点数、内存（字节），任一耗尽即停止。
+
+    stop 为 threading.Event，其他线程 set() 后搜索在本轮结束时停止并返回当前最佳走法。
+    early_stop 为 True 时，访问次数最多的子节点领先第二名超过剩余模拟次数（按已用速度估算剩余时间能跑的次数）
+    即提前结束，此时再搜索也改变不了访问次数的排名。
+    """
+
+    def __init__(self, search_numbers=None, time_limit=None, max_nodes=None, max_memory=None, early_stop=False,
+                 stop=None):
+        if search_numbers is None and time_limit is None and max_nodes is None and max_memory is None \
+                and stop is None:
+            raise ValueError("search needs search_numbers, time_limit, max_nodes, max_memory or stop.")
+        self.search_numbers = search_numbers
+        self.time_limit = time_limit
+        self.max_nodes = max_nodes
+        self.max_memory = max_memory
+        self.early_stop = early_stop
+        self.stop = stop
+
+        self.start = time.perf_counter()
+        self.simulations = 0
+        self.nodes = 0
+        self.memory = 0
+        self.reason = None
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def remaining(self):
+        # 剩余还能做的模拟次数；没有次数和时间限制时为无穷大
+        remaining = math.inf
+        if self.search_numbers is not None:
+            remaining = self.search_numbers - self.simulations
+        if self.time_limit is not None:
+            elapsed = self.elapsed()
+            if elapsed >= self.time_limit:
+                return 0
+            if self.simulations != 0:
+                remaining = min(remaining, (self.time_limit - elapsed) * self.simulations / elapsed)
+        return remaining
+
+    def progress(self):
+        # verbose 输出用：只有设置了模拟次数时才显示总数
+        if self.search_numbers is None:
+            return f"{self.simulations}"
+        return f"{self.simulations}/{self.search_numbers}"
+
+    def round_size(self, batch_size):
+        if self.search_numbers is None:
+            return batch_size
+        return min(batch_size, self.search_numbers - self.simulations)
+
+    def exhausted(self, visit_lead):
+        # visit_lead() 返回根节点访问次数最多与第二多的子节点之差，只在 early_stop 时调用
+        if self.stop is not None and self.stop.is_set():
+            self.reason = 'stopped'
+        elif self.search_numbers is not None and self.simulations >= self.search_numbers:
+            self.reason = 'simulations'
+        elif self.time_limit is not None and self.elapsed() >= self.time_limit:
+            self.reason = 'time'
+        elif self.max_nodes is not None and self.nodes >= self.max_nodes:
+            self.reason = 'nodes'
+        elif self.max_memory is not None and self.memory >= self.max_memory:
+            self.reason = 'memory'
+        elif self.early_stop and self.simulations != 0 and visit_lead() > self.remaining():
+            self.reason = 'decided'
+        return self.reason is not None
+
+    def stats(self):
+        return {'reason': self.reason, 'simulations': self.simulations, 'nodes': self.nodes, 'memory': self.memory,
+                'seconds': self.elapsed()}
 
 
 class Mcts:
     @staticmethod
-    def search(root: TreeNode, search_numbers):
-        for _ in range(search_numbers):
-            print(f"loop {_ + 1}/{search_numbers}")
-            node = Mcts.__select(root)
-            # rollout = Mcts.__rollout(node)
-            Mcts.__back_propagate_with_net(node)
-
-        best_move = Mcts.__select_best(root, 0)
+    def search(root: TreeNode, search_numbers=None, table=None, batch_size=1, virtual_loss=1, cache=None, predict=None,
+               time_limit=None, max_nodes=None, max_memory=None, early_stop=False, stop=None, verbose=1,
+               telemetry=None, rollout_weight=None):
+        # table 为 TranspositionTable 时，不同走子顺序到达的同一局面共享节点，搜索树变为有向图；
+        # 可能构成重复局面的节点不共享，但共享节点的子树仍沿用第一次创建它时那条路径的局面历史
+        # batch_size > 1 时每轮用虚拟损失选出至多 batch_size 个叶子，一次 predict 批量评估
+        # cache 为 EvaluationCache 时，已评估过的局面直接取缓存结果，不再进入 predict 的批次
+        # predict 为与 model.predict 接口相同的函数，默认用本进程的 model
+        # root 也可以是 node_store.ArrayTree，节点数据存放在连续数组里，此时不支持 table
+        # 其余参数是预算，见 SearchBudget：search_numbers、time_limit、max_nodes、max_memory 可以任意组合，
+        # 任一耗尽即返回当前最佳走法；nodes 和 memory 只统计本次搜索新建的节点
+        # verbose 为 0 时不输出，1 时搜索结束输出根节点和各子节点，2 时再输出每次模拟的 loop 行
+        # telemetry 为 telemetry.SearchTelemetry 时记录各阶段耗时和计数，搜索结束交给它的 callback
+        # rollout_weight 为叶子价值中 rollout 结果的权重：0 只用网络，1 只用 rollout（不调用网络，先验均匀），
+        # 之间按权重混合；默认在没有 predict 且 has_trained_model() 为 False 时为 1，否则为 0
+        if rollout_weight is None:
+            rollout_weight = 1.0 if predict is None and not has_trained_model() else .0
+        budget = SearchBudget(search_numbers, time_limit, max_nodes, max_memory, early_stop, stop)
+        if telemetry is None:
+            telemetry = NULL_TELEMETRY
+        telemetry.start()
+        if isinstance(root, ArrayTree):
+            if table is not None:
+                raise ValueError("transposition table is not supported on ArrayTree.")
+            return Mcts.__search_array_tree(root, budget, batch_size, virtual_loss, cache, predict, verbose, telemetry,
+                                            rollout_weight)
+
+        if table is not None:
+            root_key = root.board.table_key()
+            if root_key is not None and root_key not in table:
+                table.put(root_key, root)
+
+        while not budget.exhausted(lambda: Mcts.__visit_lead([child.visits for child in root.get_children()])):
+            round_size = budget.round_size(batch_size)
+            started = telemetry.clock()
+            pending = Mcts.__select_batch(root, round_size, virtual_loss, telemetry)
+            telemetry.add('select', started)
+            for path, _ in pending:
+                telemetry.record_path(len(path) - 1)
+
+            evaluations = Mcts.__evaluate([path[-1] for path, expandable in pending if expandable], cache, predict,
+                                          telemetry, rollout_weight)
+
+            for path, expandable in pending:
+                budget.simulations += 1
+                if verbose >= 2:
+                    print(f"loop {budget.progress()}")
+                if round_size > 1:
+                    Mcts.__apply_virtual_loss(path, -virtual_loss)
+                if expandable:
+                    policy_pred, value = evaluations.pop(0)
+                    started = telemetry.clock()
+                    child = Mcts.__expand(path[-1], policy_pred, value, table)
+                    telemetry.add('expand', started)
+                    telemetry.count('expansions')
+                    budget.nodes += len(path[-1].childMap)
+                    if child is not None and not any(node is child for node in path):
+                        path.append(child)
+                started = telemetry.clock()
+                Mcts.__back_propagate_with_net(path)
+                telemetry.add('backup', started)
+            budget.memory = budget.nodes * TREE_NODE_BYTES
+
+        best_move = Mcts.best_move(root)
+        telemetry.count('simulations', budget.simulations)
+        telemetry.count('nodes', budget.nodes)
+        telemetry.finish(budget=budget.stats())
+        if verbose < 1:
+            return best_move
 
         name = '{} / {}, {}'.format(0 if root.get_visits() == 0 else root.get_scores() / root.get_visits(),
                                     root.get_visits(),
@@ -129,7 +331,32 @@ class Mcts:
                                         child.get_visits(),
                                         child.board.encode())
             print(name)
-        return best_move.get_move()
+        if table is not None:
+            print('transposition table: {}'.format(table.stats()))
+        if cache is not None:
+            print('evaluation cache: {}'.format(cache.stats()))
+        print('search budget: {}'.format(budget.stats()))
+        return best_move
+
+    @staticmethod
+    def best_move(root):
+        # 当前最佳走法：访问次数最多的子节点，与 early_stop 的判断和 ParallelSearch.root_parallel 一致
+        # 搜索进行中也可以调用；根节点还没扩展时返回 None
+        if isinstance(root, ArrayTree):
+            children = root.children(ROOT)
+            if len(children) == 0:
+                return None
+            return root.get_move(children[int(root.visits[children.start:children.stop].argmax())])
+        if len(root.childMap) == 0:
+            return None
+        return root.get_child_move(max(root.childMap.values(), key=TreeNode.get_visits))
+
+    @staticmethod
+    def __visit_lead(visits):
+        if len(visits) < 2:
+            return sum(visits)
+        first, second = sorted(visits)[-2:][::-1]
+        return first - second
 
     @staticmethod
     def __back_propagate(node: TreeNode, rollout_score):
@@ -140,42 +367,45 @@ class Mcts:
             parent = parent.get_parent()
 
     @staticmethod
-    def __back_propagate_with_net(node: TreeNode):
-        node.visits += 1
-        parent = node.get_parent()
-        while parent is not None:
+    def __back_propagate_with_net(path):
+        # 沿本次选择的实际路径回传，节点被多个父节点共享时也只更新走过的那条路径
+        # 终局叶子用 terminal_score 的确定结果代替扩展时网络给的估值
+        node = path[-1]
+        if node.is_terminal():
+            score = node.terminal_score()
+            if node.get_visits() == 0:
+                node.scores = score
+            else:
+                node.accumulate_scores(score)
+        elif node.get_visits() == 0:
+            score = node.get_scores()
+        else:
+            score = node.get_scores() / node.get_visits()
+            node.accumulate_scores(score)
+        node.increase_visits()
+        for parent in reversed(path[:-1]):
             parent.increase_visits()
-            parent.accumulate_scores(node.get_scores())
-            parent = parent.get_parent()
-
-    @staticmethod
-    def __rollout(node: TreeNode):
-        current = node.replica()
-        return current.rollout()
+            parent.accumulate_scores(score)
 
     @staticmethod
     def __select_best(current: TreeNode, exploration_constant):
+        # 所有子节点都由当前局面的一方走出，current_player 和 sqrt(N) 对每个子节点相同，提到循环外
+        # 子节点是 Python 对象，收集成数组的开销比 PUCT 计算本身还大，这里保留标量循环；
+        # ArrayTree 直接在数组上计算，见 node_store.select_puct，两者的选择与平局处理相同
+        current_player = 1.0 if current.board.is_red_turn() else -1.0
+        sqrt_visits = math.sqrt(current.get_visits())
         best_score = float('-inf')
         best_moves = []
 
-        for child in current.get_children():
-            current_player = 1.0 if child.get_last_turn() == 'red' else -1.0
-            exploitation = .0
-
-            if child.get_visits() != 0:
-                exploitation = (
-                        current_player * child.get_scores() / child.get_visits()) if child.get_visits() > 0 else 0
-
-            # exploration = exploration_constant * math.sqrt(math.log(float(current.get_visits()) / child.get_visits()))
-            exploration = exploration_constant * child.probability * \
-                          (math.sqrt(current.get_visits()) / (1 + child.get_visits()))
-
-            move_score = exploitation + exploration
+        for child, (_, probability) in zip(current.childMap.values(), current.edges.values()):
+            visits = child.visits
+            exploitation = current_player * child.scores / visits if visits != 0 else .0
+            move_score = exploitation + exploration_constant * probability * (sqrt_visits / (1 + visits))
 
             if move_score > best_score:
                 best_moves = [child]
                 best_score = move_score
-            elif math.fabs(move_score - best_score) < 0.0001:
+            elif best_score - move_score < 0.0001:
                 best_moves.append(child)
 
         if len(best_moves) == 0:
@@ -184,37 +414,236 @@ class Mcts:
         return random.choice(best_moves)
 
     @staticmethod
-    def __expand(current: TreeNode):
-        state_tensor = to_tensor(current)
-        policy_pred, value_pred = model.predict(np.expand_dims(state_tensor, axis=0))
-        policy_pred = np.squeeze(policy_pred, axis=0)
+    def __evaluate(leaves, cache=None, predict=None, telemetry=NULL_TELEMETRY, rollout_weight=.0):
+        # 返回与 leaves 一一对应的 (policy, value)，缓存未命中的叶子合成一个批次调用 predict
+        if rollout_weight == 1.0:
+            return [(UNIFORM_POLICY, value) for value in Mcts.__rollout(leaves, telemetry)]
+
+        evaluations = [None] * len(leaves)
+        misses = []
+        for i, leaf in enumerate(leaves):
+            if cache is not None:
+                evaluations[i] = cache.get(position_key(leaf))
+            if evaluations[i] is None:
+                misses.append(i)
+        if cache is not None:
+            telemetry.count('cache_hits', len(leaves) - len(misses))
+            telemetry.count('cache_misses', len(misses))
+
+        if len(misses) != 0:
+            if predict is None:
+                predict = get_model().predict
+            started = telemetry.clock()
+            tensors = encode_batch([leaves[i] for i in misses])
+            telemetry.add('encode', started)
+            started = telemetry.clock()
+            policy_preds, value_preds = predict(tensors)
+            telemetry.add('inference', started)
+            telemetry.count('predict_calls')
+            telemetry.count('predicted_positions', len(misses))
+            for i, policy_pred, value_pred in zip(misses, policy_preds, value_preds):
+                evaluations[i] = (policy_pred, value_pred.item())
+                if cache is not None:
+                    cache.put(position_key(leaves[i]), policy_pred, value_pred.item())
+
+        if rollout_weight > 0:
+            # 缓存里只存网络输出，rollout 每次重新做
+            rollout_values = Mcts.__rollout(leaves, telemetry)
+            evaluations = [(policy_pred, (1 - rollout_weight) * value + rollout_weight * rollout_value)
+                           for (policy_pred, value), rollout_value in zip(evaluations, rollout_values)]
+        return evaluations
 
-        possible_moves = current.get_possible_moves()
-        for i, possible_move in enumerate(possible_moves):
-            board, src, dst = possible_move
-            probability = get_probability(src, dst, policy_pred)
-            child_node = TreeNode(board, current, (src, dst), probability)
-
-            child_node.scores = value_pred.item()
+    @staticmethod
+    def __rollout(leaves, telemetry=NULL_TELEMETRY):
+        started = telemetry.clock()
+        values = [play_rollout(leaf.board) for leaf in leaves]
+        telemetry.add('rollout', started)
+        telemetry.count('rollouts', len(leaves))
+        return values
 
-            current.childMap[board.encode()] = child_node
+    @staticmethod
+    def __expand(current: TreeNode, policy_pred, value, table=None):
+        # 走法在选择时已经生成，扩展后释放
+        board = current.board
+        moves = current.legal_moves()
+        current.moves = None
+        priors = get_priors(moves, policy_pred)
+        for (src, dst), probability in zip(moves, priors):
+            probability = float(probability)
+            child_node = None
+            # 终局与否还取决于未吃子步数和重复局面，置换表按 table_key 共享，可能重复的局面不共享
+            table_key = board.table_key_after_move(src, dst) if table is not None else None
+            if table_key is not None:
+                child_node = table.get(table_key)
+            if child_node is None:
+                child_node = TreeNode(board.apply_move(src, dst), current, (src, dst), probability)
+                child_node.scores = value
+                if table_key is not None:
+                    table.put(table_key, child_node)
+
+            current.add_child(child_node, (src, dst), probability)
 
         if len(current.childMap) != 0:
-            best_child = max(current.childMap.values(), key=lambda child: child.probability)
+            best_child = max(current.childMap.values(), key=current.get_child_probability)
             return best_child
 
         return None
 
     @staticmethod
-    def __select(root: TreeNode):
+    def __select(root: TreeNode, telemetry=NULL_TELEMETRY):
+        # 返回从根到叶子的路径，以及叶子是否需要扩展（终局或成环时不需要）
+        path = [root]
         current = root
-        while current is not None and not current.is_terminal():
-            if current.is_fully_expanded():
-                current = Mcts.__select_best(current, 2)
+        while True:
+            if current.num_moves is None:
+                # 第一次走到该节点时生成走法，终局判断、是否完全展开和扩展都用这一份
+                started = telemetry.clock()
+                current.legal_moves()
+                telemetry.add('movegen', started)
+            if current.is_terminal():
+                break
+            if not current.is_fully_expanded():
+                return path, True
+            current = Mcts.__select_best(current, 2)
+            if any(node is current for node in path):
+                # 置换表使局面成环，停在环上回传
+                break
+            path.append(current)
+
+        return path, False
+
+    @staticmethod
+    def __select_batch(root: TreeNode, batch_size, virtual_loss, telemetry=NULL_TELEMETRY):
+        pending = []
+        while len(pending) < batch_size:
+            path, expandable = Mcts.__select(root, telemetry)
+            if expandable and any(leaf is path[-1] for leaf in (p[-1] for p, e in pending if e)):
+                # 选到同一个待扩展叶子，说明已没有足够分散的路径，提前结束本轮
+                break
+            pending.append((path, expandable))
+            if batch_size > 1:
+                # 给已选路径加上虚拟损失，让后续选择走向其他分支
+                Mcts.__apply_virtual_loss(path, virtual_loss)
+        return pending
+
+    @staticmethod
+    def __apply_virtual_loss(path, virtual_loss):
+        # 每个节点记 virtual_loss 次访问，并按走进该节点一方的视角记为输棋
+        for node in path:
+            node.visits += virtual_loss
+            node.scores -= virtual_loss if node.board.is_last_red_turn() else -virtual_loss
+
+    @staticmethod
+    def __search_array_tree(tree: ArrayTree, budget, batch_size, virtual_loss, cache, predict, verbose, telemetry,
+                            rollout_weight):
+        # 与 TreeNode 版本相同的选择、扩展与回传规则，节点为数组下标
+        initial_size = len(tree)
+        while not budget.exhausted(lambda: Mcts.__visit_lead(tree.visits[tree.children(ROOT)].tolist())):
+            round_size = budget.round_size(batch_size)
+            started = telemetry.clock()
+            pending = []
+            while len(pending) < round_size:
+                # moves 为叶子的合法走法，叶子不需要扩展时为 None
+                path, board, moves = Mcts.__select_array_tree(tree, telemetry)
+                if moves is not None and any(p[-1] == path[-1] for p, _, m in pending if m is not None):
+                    break
+                pending.append((path, board, moves))
+                if round_size > 1:
+                    Mcts.__apply_array_virtual_loss(tree, path, virtual_loss)
+            telemetry.add('select', started)
+            for path, _, _ in pending:
+                telemetry.record_path(len(path) - 1)
+
+            leaves = [Position(board, None if path[-1] == ROOT else tree.get_move(path[-1]))
+                      for path, board, moves in pending if moves is not None]
+            evaluations = Mcts.__evaluate(leaves, cache, predict, telemetry, rollout_weight)
+
+            for path, board, moves in pending:
+                budget.simulations += 1
+                if verbose >= 2:
+                    print(f"loop {budget.progress()}")
+                if round_size > 1:
+                    Mcts.__apply_array_virtual_loss(tree, path, -virtual_loss)
+                if moves is not None:
+                    policy_pred, value = evaluations.pop(0)
+                    started = telemetry.clock()
+                    priors = get_priors(moves, policy_pred)
+                    first = tree.add_children(path[-1], moves, priors, value)
+                    child = first + int(priors.argmax())
+                    path.append(child)
+                    # 与 TreeNode 相同，新扩展的子节点是终局（将死、吃将、和棋）时回传 terminal_score
+                    board.make_move(*tree.get_move(child))
+                    if board.is_game_over():
+                        tree.terminal[child] = True
+                    telemetry.add('expand', started)
+                    telemetry.count('expansions')
+                started = telemetry.clock()
+                Mcts.__back_propagate_array_tree(tree, path, board)
+                telemetry.add('backup', started)
+            budget.nodes = len(tree) - initial_size
+            budget.memory = budget.nodes * tree.bytes_per_node()
+
+        best_move = Mcts.best_move(tree)
+        telemetry.count('simulations', budget.simulations)
+        telemetry.count('nodes', budget.nodes)
+        telemetry.finish(budget=budget.stats())
+        if verbose < 1:
+            return best_move
+
+        print('{} / {}, {}'.format(0 if tree.visits[ROOT] == 0 else tree.scores[ROOT] / tree.visits[ROOT],
+                                   tree.visits[ROOT], tree.board.encode()))
+        for child in tree.children(ROOT):
+            print('{} / {}, {}'.format(0 if tree.visits[child] == 0 else tree.scores[child] / tree.visits[child],
+                                       tree.visits[child], tree.board.apply_move(*tree.get_move(child)).encode()))
+        print('array tree: {} nodes, {} bytes'.format(len(tree), tree.nbytes()))
+        if cache is not None:
+            print('evaluation cache: {}'.format(cache.stats()))
+        print('search budget: {}'.format(budget.stats()))
+        return best_move
+
+    @staticmethod
+    def __select_array_tree(tree: ArrayTree, telemetry=NULL_TELEMETRY):
+        # 下降时在根局面的副本上逐步走子，叶子的局面和需要扩展时的合法走法随路径一起返回
+        path = [ROOT]
+        board = tree.board.clone()
+        node = ROOT
+        while not tree.terminal[node]:
+            if not tree.is_expanded(node):
+                # 终局要生成一遍走法才能判断，第一次走到未扩展的节点时生成，扩展时直接用这一份
+                started = telemetry.clock()
+                moves = board.legal_move_list()
+                telemetry.add('movegen', started)
+                if board.is_game_over():
+                    tree.terminal[node] = True
+                    break
+                return path, board, moves
+            node = tree.select_child(node, 2)
+            board.make_move(*tree.get_move(node))
+            path.append(node)
+        return path, board, None
+
+    @staticmethod
+    def __back_propagate_array_tree(tree: ArrayTree, path, board):
+        # board 为选择时得到的叶子局面，只在叶子是终局时用来计算 terminal_score
+        leaf = path[-1]
+        if tree.terminal[leaf]:
+            score = terminal_score(board)
+            if tree.visits[leaf] == 0:
+                tree.scores[leaf] = score
             else:
-                return Mcts.__expand(current)
+                tree.scores[leaf] += score
+        elif tree.visits[leaf] == 0:
+            score = tree.scores[leaf]
+        else:
+            score = tree.scores[leaf] / tree.visits[leaf]
+            tree.scores[leaf] += score
+        tree.visits[path] += 1
+        tree.scores[path[:-1]] += score
 
-        return current
+    @staticmethod
+    def __apply_array_virtual_loss(tree: ArrayTree, path, virtual_loss):
+        tree.visits[path] += virtual_loss
+        tree.scores[path] += [virtual_loss if tree.red_to_move[node] else -virtual_loss for node in path]
 
     @staticmethod
     def draw_search_tree(root: TreeNode):
@@ -225,7 +654,62 @@ class Mcts:
                 f.write(("%s%s\n" % (pre, node.name)))
 
 
-def dump(node: TreeNode, parent, dic):
+class SearchSession:
+    """跨回合保留搜索树：每走一步把根推进到对应子节点，继续在保留的子树上搜索。"""
+
+    def __init__(self, board=None, **search_options):
+        # search_options 原样传给 Mcts.search，例如 table、cache、batch_size、time_limit、verbose、telemetry、
+        # rollout_weight
+        self.root = TreeNode.start_node(Board() if board is None else board)
+        self.search_options = search_options
+        self.reused_visits = 0
+        self.stop = threading.Event()
+
+    def search(self, search_numbers=None, **limits):
+        # limits 覆盖构造时的同名参数，例如 session.search(time_limit=0.5)
+        self.stop.clear()
+        options = dict(self.search_options, stop=self.stop)
+        options.update(limits)
+        return Mcts.search(self.root, search_numbers, **options)
+
+    def interrupt(self):
+        # 可在其他线程调用，正在进行的搜索在本轮结束时返回当前最佳走法
+        self.stop.set()
+
+    def best_move(self):
+        return Mcts.best_move(self.root)
+
+    def advance(self, move):
+        # 走子后推进根节点，返回是否复用了已有子树
+        src, dst = move
+        old_root = self.root
+        child = old_root.childMap.get(old_root.board.hash_after_move(src, dst))
+        if child is not None and old_root.get_child_move(child) != (src, dst):
+            child = None
+
+        if child is None:
+            self.root = TreeNode(old_root.board.move(src, dst), None, (src, dst))
+            self.reused_visits = 0
+        else:
+            # 断开与旧根及兄弟子树的引用，让它们尽快被回收
+            child.parent = None
+            self.root = child
+            self.reused_visits = child.get_visits()
+
+        old_root.childMap = {}
+        old_root.edges = {}
+        return child is not None
+
+    def reset(self, board=None):
+        self.root = TreeNode.start_node(Board() if board is None else board)
+        self.reused_visits = 0
+
+
+def dump(node: TreeNode, parent, dic, visited=None):
+    if visited is None:
+        visited = set()
+    visited.add(id(node))
+
     name = '{} / {}, {}'.format(0 if node.get_visits() == 0 else node.get_scores() / node.get_visits(),
                                 node.get_visits(),
                                 node.board.encode())
@@ -237,56 +721,12 @@ def dump(node: TreeNode, parent, dic):
                                      v.get_visits(),
                                      v.board.encode())
         tree_list.append(child)
-        dump(v, current, dic)
+        if id(v) not in visited:
+            dump(v, current, dic, visited)
     dic[name] = tree_list
     return current
 
 
-def to_tensor(node: TreeNode):
-    # one-hot representation for each piece
-    brd = node.board
-    turn = 1 if brd.is_red_turn() else 0
-
-    piece_to_onehot = {
-        'R': np.array([1, 0, 0, 0, 0, 0, 0]),
-        'N': np.array([0, 1, 0, 0, 0, 0, 0]),
-        'B': np.array([0, 0, 1, 0, 0, 0, 0]),
-        'A': np.array([0, 0, 0, 1, 0, 0, 0]),
-        'K': np.array([0, 0, 0, 0, 1, 0, 0]),
-        'C': np.array([0, 0, 0, 0, 0, 1, 0]),
-        'P': np.array([0, 0, 0, 0, 0, 0, 1]),
-        'r': np.array([-1, 0, 0, 0, 0, 0, 0]),
-        'n': np.array([0, -1, 0, 0, 0, 0, 0]),
-        'b': np.array([0, 0, -1, 0, 0, 0, 0]),
-        'a': np.array([0, 0, 0, -1, 0, 0, 0]),
-        'k': np.array([0, 0, 0, 0, -1, 0, 0]),
-        'c': np.array([0, 0, 0, 0, 0, -1, 0]),
-        'p': np.array([0, 0, 0, 0, 0, 0, -1]),
-        '_': np.array([0, 0, 0, 0, 0, 0, 0])
-    }
-
-    # create an empty tensor
-    tensor = np.zeros((10, 9, 9))  # the dimension of the tensor is (10, 9, 9)
-
-    # fill in the tensor with one-hot encoding of the pieces
-    for i in range(10):
-        for j in range(9):
-            tensor[i, j, :7] = piece_to_onehot[brd.board[i][j]]
-
-    # fill in the tensor with the last move
-    last_step = node.move
-    if last_step is not None:
-        source, target = last_step
-        if source is not None and target is not None:
-            tensor[source[0], source[1], 7] = -1
-            tensor[target[0], target[1], 7] = 1
-
-    # fill in the tensor with the current turn
-    tensor[:, :, 8] = turn
-
-    return tensor
-
-
 def test_to_tensor():
     test_board = Board()
     # Create a root node
@@ -301,3 +741,27 @@ def test_to_tensor():
         print(next_state.encode())
         print(to_tensor(node).transpose((2, 0, 1)))
         root = node
+
+
+def test_terminal_backup():
+    # 一步杀：两种树都应回传将死的确定结果 1，而不是网络给的估值
+    from uci import get_label_index
+    rows = [['_'] * 9 for _ in range(10)]
+    rows[0][4], rows[9][3], rows[1][0], rows[5][8] = 'k', 'K', 'R', 'R'
+    mate = ((5, 8), (0, 8))
+
+    def predict(tensors):
+        policy = np.zeros((len(tensors), len(uci_labels)), dtype=np.float32)
+        policy[:, get_label_index(*mate)] = 10
+        return policy, np.full((len(tensors), 1), -0.5, dtype=np.float32)
+
+    root = TreeNode.start_node(Board(rows))
+    Mcts.search(root, 1, predict=predict, verbose=0)
+    child = next(child for child in root.get_children() if root.get_child_move(child) == mate)
+    assert child.get_visits() == 1 and child.get_scores() == 1, "TreeNode did not back up the checkmate"
+
+    tree = ArrayTree(Board(rows))
+    Mcts.search(tree, 1, predict=predict, verbose=0)
+    child = next(child for child in tree.children(ROOT) if tree.get_move(child) == mate)
+    assert tree.terminal[child] and tree.visits[child] == 1 and tree.scores[child] == 1, \
+        "ArrayTree did not back up the checkmate"
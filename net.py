@@ -1,50 +1,103 @@
+import json
+import os
+
 from keras.layers import Conv2D, BatchNormalization, Dense, Add, Flatten, Input, Activation
 from keras.models import Model
 
 
-def create_chinese_chess_model():
-    num_filters = 256
-
+def create_chinese_chess_model(num_filters=256, num_blocks=7, policy_filters=16, value_filters=8, value_hidden=256):
     # 定义骨干网络
     inputs = Input(shape=(10, 9, 9))
-    x = Conv2D(filters=num_filters, kernel_size=3, strides=1, padding='same')(inputs)
-    x = BatchNormalization()(x)
+    x = Conv2D(filters=num_filters, kernel_size=3, strides=1, padding='same', name='stem_conv')(inputs)
+    x = BatchNormalization(name='stem_bn')(x)
     x = Activation('relu')(x)
 
     # 定义残差网络
-    for _ in range(7):
+    # 层名固定，推理后端（inference.py）按名字取权重
+    for i in range(num_blocks):
         identity = x
 
-        x = Conv2D(filters=num_filters, kernel_size=3, padding='same')(x)
-        x = BatchNormalization()(x)
+        x = Conv2D(filters=num_filters, kernel_size=3, padding='same', name=f'res{i}_conv1')(x)
+        x = BatchNormalization(name=f'res{i}_bn1')(x)
         x = Activation('relu')(x)
 
-        x = Conv2D(filters=num_filters, kernel_size=3, padding='same')(x)
-        x = BatchNormalization()(x)
+        x = Conv2D(filters=num_filters, kernel_size=3, padding='same', name=f'res{i}_conv2')(x)
+        x = BatchNormalization(name=f'res{i}_bn2')(x)
 
         x = Add()([identity, x])
         x = Activation('relu')(x)
 
     # 策略头
-    policy = Conv2D(filters=16, kernel_size=1)(x)
-    policy = BatchNormalization()(policy)
+    policy = Conv2D(filters=policy_filters, kernel_size=1, name='policy_conv')(x)
+    policy = BatchNormalization(name='policy_bn')(policy)
     policy = Activation('relu')(policy)
     policy = Flatten()(policy)
-    policy = Dense(2086)(policy)
+    policy = Dense(2086, name='policy_dense')(policy)
 
     # 价值头
-    value = Conv2D(filters=8, kernel_size=1)(x)
-    value = BatchNormalization()(value)
+    value = Conv2D(filters=value_filters, kernel_size=1, name='value_conv')(x)
+    value = BatchNormalization(name='value_bn')(value)
     value = Activation('relu')(value)
     value = Flatten()(value)
-    value = Dense(256, activation='relu')(value)
-    value = Dense(1, activation='tanh')(value)
+    value = Dense(value_hidden, activation='relu', name='value_dense1')(value)
+    value = Dense(1, activation='tanh', name='value_dense2')(value)
 
     return Model(inputs=inputs, outputs=[policy, value])
 
 
-def load_model():
-    return create_chinese_chess_model()
+# create_chinese_chess_model 的网络结构参数，训练时与检查点一起保存
+ARCHITECTURE_OPTIONS = ('num_filters', 'num_blocks', 'policy_filters', 'value_filters', 'value_hidden')
+CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'checkpoints', 'latest.weights.h5')
+
+
+def architecture_path(weights_path):
+    # 与检查点放在一起的网络结构文件：latest.weights.h5 -> latest.architecture.json
+    if weights_path.endswith('.weights.h5'):
+        weights_path = weights_path[:-len('.weights.h5')]
+    return weights_path + '.architecture.json'
+
+
+def save_architecture(weights_path, model_options):
+    with open(architecture_path(weights_path), 'w') as f:
+        json.dump(model_options, f, indent=1, sort_keys=True)
+
+
+def resolve_architecture(weights_path=CHECKPOINT_PATH, **model_options):
+    """检查点旁边保存的网络结构，加上 model_options；两者给出不同的值时报错。"""
+    saved = {}
+    if weights_path is not None and os.path.exists(architecture_path(weights_path)):
+        with open(architecture_path(weights_path)) as f:
+            saved = json.load(f)
+    conflicts = sorted(name for name, value in model_options.items() if name in saved and saved[name] != value)
+    if conflicts:
+        raise ValueError(f"{weights_path} was trained with {', '.join(f'{name}={saved[name]}' for name in conflicts)}")
+    return dict(saved, **model_options)
+
+
+def load_model(weights_path=CHECKPOINT_PATH, **model_options):
+    # 有训练好的检查点时加载权重，否则返回随机初始化的网络
+    # 网络结构按 resolve_architecture() 决定，训练时保存过结构的检查点不用再传 model_options
+    model = create_chinese_chess_model(**resolve_architecture(weights_path, **model_options))
+    if weights_path is not None and os.path.exists(weights_path):
+        model.load_weights(weights_path)
+    return model
+
+
+def test_architecture():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        weights_path = os.path.join(directory, 'slim.weights.h5')
+        slim = create_chinese_chess_model(num_filters=32, num_blocks=1, value_hidden=32)
+        slim.save_weights(weights_path)
+        save_architecture(weights_path, {'num_filters': 32, 'num_blocks': 1, 'value_hidden': 32})
+        assert load_model(weights_path).count_params() == slim.count_params(), "architecture not restored"
+        try:
+            load_model(weights_path, num_filters=64)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("conflicting architecture not rejected")
 
 
 if __name__ == '__main__':
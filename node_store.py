@@ -0,0 +1,182 @@
+import math
+import random
+
+import numpy as np
+
+from Board import COLS, NUM_SQUARES, POSITIONS
+
+ROOT = 0
+NO_CHILDREN = -1
+
+# 每个字段一个连续数组，节点用下标表示；子节点在扩展时一次性连续分配
+FIELDS = {
+    'visits': np.int64,
+    'scores': np.float64,
+    'priors': np.float64,
+    'parents': np.int32,
+    'first_child': np.int32,
+    'num_children': np.int32,
+    'moves': np.int16,  # src_square * 90 + dst_square，根节点为 -1
+    'terminal': np.bool_,
+    'red_to_move': np.bool_,
+}
+
+
+def select_puct(visits, scores, priors, parent_visits, current_player, exploration_constant, rng=random):
+    """一次计算全部子节点的 PUCT 分数，返回被选中子节点的下标。
+
+    与逐个比较的写法结果相同：分数最高的第一个子节点，加上它之后与最高分相差不到 1e-4 的子节点，
+    从中用 rng.choice 选一个；rng 为 None 时固定取第一个。
+    """
+    if len(visits) == 0:
+        raise Exception("best move is empty.")
+    exploitation = np.where(visits != 0, current_player * scores / np.maximum(visits, 1), .0)
+    exploration = exploration_constant * priors * (math.sqrt(parent_visits) / (1 + visits))
+    move_scores = exploitation + exploration
+    first = int(move_scores.argmax())
+    best_moves = first + np.flatnonzero(move_scores[first:] > move_scores[first] - 0.0001)
+    return int(best_moves[0]) if rng is None else int(rng.choice(best_moves))
+
+
+def encode_move(move):
+    (sx, sy), (dx, dy) = move
+    return (sx * COLS + sy) * NUM_SQUARES + dx * COLS + dy
+
+
+def decode_move(code):
+    src, dst = divmod(int(code), NUM_SQUARES)
+    return POSITIONS[src], POSITIONS[dst]
+
+
+class ArrayTree:
+    """结构数组（struct-of-arrays）形式的搜索树。
+
+    节点只保存走法，不保存局面；需要局面时从根局面沿路径重放走法。visits、scores 的含义与 TreeNode 相同，
+    priors 保存父节点到该节点这条边的先验概率。
+    """
+
+    def __init__(self, board, capacity=4096):
+        self.board = board.clone()
+        self.size = 0
+        for name, dtype in FIELDS.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.__allocate(1)
+        self.parents[ROOT] = NO_CHILDREN
+        self.moves[ROOT] = -1
+        self.terminal[ROOT] = board.is_game_over()
+        self.red_to_move[ROOT] = board.is_red_turn()
+
+    def __len__(self):
+        return self.size
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in FIELDS)
+
+    def bytes_per_node(self):
+        return sum(np.dtype(dtype).itemsize for dtype in FIELDS.values())
+
+    def children(self, node):
+        first = self.first_child[node]
+        return range(first, first + self.num_children[node]) if first != NO_CHILDREN else range(0)
+
+    def is_expanded(self, node):
+        return self.first_child[node] != NO_CHILDREN
+
+    def get_move(self, node):
+        return decode_move(self.moves[node])
+
+    def path_to(self, node):
+        path = []
+        while node != NO_CHILDREN:
+            path.append(node)
+            node = self.parents[node]
+        return path[::-1]
+
+    def board_at(self, node):
+        # 从根局面重放走法得到节点局面
+        board = self.board.clone()
+        for step in self.path_to(node)[1:]:
+            board.make_move(*self.get_move(step))
+        return board
+
+    def add_children(self, node, moves, priors, value):
+        # 一次分配 node 的全部子节点，返回第一个子节点下标；子节点是否终局在选择走到它时才判断
+        count = len(moves)
+        first = self.__allocate(count)
+        children = slice(first, first + count)
+        self.first_child[node] = first
+        self.num_children[node] = count
+        self.parents[children] = node
+        self.priors[children] = priors
+        self.scores[children] = value
+        self.red_to_move[children] = not self.red_to_move[node]
+        self.moves[children] = [encode_move(move) for move in moves]
+        return first
+
+    def select_child(self, node, exploration_constant, rng=random):
+        first = self.first_child[node]
+        children = slice(first, first + self.num_children[node])
+        return first + select_puct(self.visits[children], self.scores[children], self.priors[children],
+                                   self.visits[node], 1.0 if self.red_to_move[node] else -1.0,
+                                   exploration_constant, rng)
+
+    def __allocate(self, count):
+        start = self.size
+        if start + count > len(self.visits):
+            capacity = max(2 * len(self.visits), start + count)
+            for name in FIELDS:
+                array = getattr(self, name)
+                grown = np.zeros(capacity, dtype=array.dtype)
+                grown[:start] = array[:start]
+                setattr(self, name, grown)
+        self.size = start + count
+        self.first_child[start:self.size] = NO_CHILDREN
+        return start
+
+
+def test_select_puct():
+    # 与 Mcts.__select_best 的逐个比较写法对照：候选集合必须完全相同，包括相差不到 1e-4 的平局和未访问的子节点
+    class Recorder:
+        def __init__(self):
+            self.candidates = None
+
+        def choice(self, candidates):
+            self.candidates = [int(i) for i in candidates]
+            return candidates[0]
+
+    def scalar_candidates(visits, scores, priors, parent_visits, current_player, exploration_constant):
+        sqrt_visits = math.sqrt(parent_visits)
+        best_score = float('-inf')
+        best_moves = []
+        for i in range(len(visits)):
+            exploitation = current_player * scores[i] / visits[i] if visits[i] != 0 else .0
+            move_score = exploitation + exploration_constant * priors[i] * (sqrt_visits / (1 + visits[i]))
+            if move_score > best_score:
+                best_moves = [i]
+                best_score = move_score
+            elif best_score - move_score < 0.0001:
+                best_moves.append(i)
+        return best_moves
+
+    rng = np.random.default_rng(0)
+    for _ in range(2000):
+        count = int(rng.integers(1, 40))
+        visits = rng.integers(0, 6, size=count) * (rng.random(count) < 0.7)
+        scores = (rng.random(count) * 2 - 1) * visits
+        priors = rng.random(count) / count
+        # 复制出若干个完全相同的子节点，再把其中一些的先验挪动一点，得到差距在 1e-4 两侧的近似平局
+        twins = rng.integers(0, count, size=count // 3)
+        visits[twins], scores[twins], priors[twins] = visits[0], scores[0], priors[0]
+        priors[twins] += rng.choice([.0, 1e-6, 5e-5, -5e-5, 3e-4], size=len(twins))
+        parent_visits = int(visits.sum()) + int(rng.integers(0, 3))
+        current_player = float(rng.choice([1.0, -1.0]))
+        exploration_constant = float(rng.choice([.0, 2.0]))
+
+        recorder = Recorder()
+        chosen = select_puct(visits, scores, priors, parent_visits, current_player, exploration_constant, recorder)
+        expected = scalar_candidates(visits.tolist(), scores.tolist(), priors.tolist(), parent_visits,
+                                     current_player, exploration_constant)
+        assert recorder.candidates == expected, "select_puct candidates differ from the scalar loop"
+        assert chosen == expected[0]
+        assert select_puct(visits, scores, priors, parent_visits, current_player, exploration_constant,
+                           None) == expected[0], "rng=None should pick the first candidate"
@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from mcts import Mcts, TreeNode
+
+
+def init_worker(clients=None, next_client=None):
+    # 在进程初始化时加载模型，避免计入第一次搜索的时间；给定推理服务的客户端时改用客户端
+    import mcts
+    if clients is None:
+        mcts.get_model()
+        return
+    with next_client.get_lock():
+        client = clients[next_client.value]
+        next_client.value += 1
+    mcts.set_model(client)
+
+
+def _root_search(board, search_numbers, seed, search_options):
+    random.seed(seed)
+    root = TreeNode.start_node(board)
+    Mcts.search(root, search_numbers, **search_options)
+    return {root.get_child_move(child): (child.get_visits(), child.get_scores()) for child in root.get_children()}
+
+
+def _warm_up(delay):
+    # 跑一次预测，第一次 predict 的图构建也不计入之后的计时
+    import mcts
+    from Board import Board
+    from encoder import Position, encode_batch
+    mcts.get_model().predict(encode_batch([Position(Board(), None)]))
+    time.sleep(delay)
+    return os.getpid()
+
+
+def _predict(tensors):
+    import mcts
+    return mcts.get_model().predict(tensors)
+
+
+def merge_root_statistics(results):
+    # 合并各进程根节点子节点的 (visits, scores)
+    merged = {}
+    for statistics in results:
+        for move, (visits, scores) in statistics.items():
+            total_visits, total_scores = merged.get(move, (0, 0))
+            merged[move] = (total_visits + visits, total_scores + scores)
+    return merged
+
+
+class ParallelSearch:
+    """用进程池做多核 MCTS。
+
+    root_parallel：K 个进程从同一局面各自独立搜索，合并根节点子节点的访问次数后选访问最多的走法。
+    leaf_parallel：主进程用虚拟损失选出一批互不相同的叶子，按进程数切分后并行评估，再在主进程扩展回传。
+    并行的只有网络评估：选择、走法生成、编码、建子节点和回传都要读写主进程里的同一棵树，留在主进程；
+    每个叶子的输入张量（约 3 KB）要 pickle 给各自加载了一份模型的进程。随机网络下评估占搜索时间的 95% 以上，
+    主进程部分不到 5%，所以把扩展也放到子进程收益有限。
+    """
+
+    def __init__(self, workers=4, server=None):
+        # server 为已启动的 InferenceServer 时，各进程通过它的客户端评估，不再各自加载模型
+        self.workers = workers
+        initargs = ()
+        if server is not None:
+            if len(server.clients) < workers:
+                raise ValueError(f"inference server has {len(server.clients)} clients for {workers} workers")
+            initargs = (server.clients[:workers], multiprocessing.Value('i', 0))
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def warm_up(self, delay=0.05):
+        # 进程池在第一次提交任务时才启动进程，并在 init_worker 里加载模型；计时前先让每个进程都做过一次预测
+        # 任务里稍等 delay 秒，让任务分散到各个进程，直到见过全部进程为止
+        pids = set()
+        while len(pids) < self.workers:
+            pids.update(self.executor.map(_warm_up, [delay] * self.workers))
+
+    def root_parallel(self, board, search_numbers, seed=None, **search_options):
+        # search_numbers 为总模拟次数，平均分给各进程
+        seeds = random.Random(seed).sample(range(1 << 30), self.workers)
+        per_worker = -(-search_numbers // self.workers)
+        futures = [self.executor.submit(_root_search, board, per_worker, seeds[i], search_options)
+                   for i in range(self.workers)]
+        merged = merge_root_statistics(future.result() for future in futures)
+        if len(merged) == 0:
+            raise Exception("best move is empty.")
+        return max(merged, key=lambda move: merged[move][0])
+
+    def leaf_parallel(self, root: TreeNode, search_numbers, batch_size=None, **search_options):
+        if batch_size is None:
+            batch_size = 8 * self.workers
+        return Mcts.search(root, search_numbers, batch_size=batch_size, predict=self.predict, **search_options)
+
+    def predict(self, tensors):
+        chunks = [chunk for chunk in np.array_split(tensors, self.workers) if len(chunk) != 0]
+        results = list(self.executor.map(_predict, chunks))
+        return np.concatenate([policy for policy, _ in results]), np.concatenate([value for _, value in results])
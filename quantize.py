@@ -0,0 +1,81 @@
+import argparse
+import random
+
+import numpy as np
+
+from Board import Board
+from encoder import Position, encode_batch
+from uci import get_label_indices
+
+
+def sample_positions(count=512, seed=0, max_moves=120):
+    """随机对局中取局面，返回 (tensors, 每个局面的合法走法)。"""
+    rng = random.Random(seed)
+    nodes, moves = [], []
+    while len(nodes) < count:
+        board, last_step = Board(), None
+        for _ in range(rng.randrange(max_moves)):
+            if board.is_game_over():
+                break
+            legal_moves = list(board.legal_moves())
+            nodes.append(Position(board, last_step))
+            moves.append(legal_moves)
+            last_step = rng.choice(legal_moves)
+            board = board.apply_move(*last_step)
+            if len(nodes) == count:
+                break
+    return encode_batch(nodes), moves
+
+
+def replay_positions(path, count=512, seed=0):
+    # 从回放缓冲区取自我对弈中真实出现过的局面
+    from replay_buffer import ReplayBuffer
+
+    planes, _, _ = ReplayBuffer(path).sample(count, rng=np.random.default_rng(seed))
+    return planes.astype(np.float32)
+
+
+def quantize_model(model, calibration, int8=True):
+    """训练后量化导出 TFLite 模型，calibration 为校准用的编码局面；输入输出保持 float32。"""
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if int8:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([calibration[i:i + 1]] for i in range(len(calibration)))
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+def compare(backend, reference, tensors, moves):
+    """对比两个后端：合法走法中最优走法一致的比例、价值的平均绝对误差与符号一致率。"""
+    policy, value = backend.predict(tensors)
+    expected_policy, expected_value = reference.predict(tensors)
+
+    agree = 0
+    for i, legal_moves in enumerate(moves):
+        indices = get_label_indices(legal_moves)
+        agree += np.argmax(policy[i][indices]) == np.argmax(expected_policy[i][indices])
+
+    value, expected_value = value.reshape(-1), expected_value.reshape(-1)
+    return {
+        'policy_top1_agreement': float(agree / len(moves)),
+        'value_mae': float(np.mean(np.abs(value - expected_value))),
+        'value_sign_agreement': float(np.mean(np.sign(value) == np.sign(expected_value))),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='export a post-training quantized TFLite model')
+    parser.add_argument('--out', default='model-int8.tflite')
+    parser.add_argument('--replay', default=None, help='replay buffer used as the calibration set')
+    parser.add_argument('--positions', type=int, default=512)
+    parser.add_argument('--float32', action='store_true', help='export without int8 quantization')
+    args = parser.parse_args()
+
+    from net import load_model
+
+    calibration = replay_positions(args.replay, args.positions) if args.replay else \
+        sample_positions(args.positions)[0]
+    with open(args.out, 'wb') as f:
+        f.write(quantize_model(load_model(), calibration, int8=not args.float32))
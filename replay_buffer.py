@@ -0,0 +1,203 @@
+import argparse
+import glob
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+from uci import uci_labels
+
+# 每个字段一个定长记录的二进制文件，按局面追加写入，读取时整体 memmap
+FIELDS = {
+    'planes': (np.int8, (10, 9, 9)),
+    'policies': (np.float16, (len(uci_labels),)),
+    'outcomes': (np.int8, ()),
+}
+INDEX_FILE = 'games.npy'
+# 已导入的分片：绝对路径 -> 导入完成后的对局数
+IMPORTED_FILE = 'imported.json'
+
+
+class ReplayBuffer:
+    """磁盘上的回放缓冲区。
+
+    path 目录下 planes.bin / policies.bin / outcomes.bin 按局面顺序存放定长记录，
+    games.npy 记录每局的 (起始局面, 局面数)。读取通过 np.memmap 完成，不会把整个缓冲区载入内存。
+    games.npy 是唯一可信的长度：写入中断时记录文件里多出的部分在下次打开时截掉。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        index_path = os.path.join(path, INDEX_FILE)
+        self.games = np.load(index_path) if os.path.exists(index_path) else np.zeros((0, 2), dtype=np.int64)
+        self.__maps = None
+        self.__truncate_records()
+        imported_path = os.path.join(path, IMPORTED_FILE)
+        imported = {}
+        if os.path.exists(imported_path):
+            with open(imported_path) as f:
+                imported = json.load(f)
+        # 先记分片再写索引；索引没来得及写入的分片不算已导入
+        self.imported = {shard: games for shard, games in imported.items() if games <= len(self.games)}
+
+    def __len__(self):
+        return int(self.games[:, 1].sum()) if len(self.games) else 0
+
+    def num_games(self):
+        return len(self.games)
+
+    def append_game(self, planes, policies, outcome):
+        self.__write_games([(planes, policies, outcome)])
+        self.__save_index()
+
+    def import_shards(self, pattern):
+        # 导入 selfplay.py 写出的分片，按 game_ids 拆成对局，返回本次导入的分片
+        # 每个分片导入后保存一次索引并记入 imported.json，已导入的分片跳过，中断后可以直接重试
+        shards = []
+        for shard in sorted(glob.glob(pattern)):
+            shard = os.path.abspath(shard)
+            if shard in self.imported:
+                continue
+            with np.load(shard) as data:
+                planes, policies, outcomes, game_ids = data['planes'], data['policies'], data['outcomes'], \
+                    data['game_ids']
+            boundaries = np.flatnonzero(np.diff(game_ids)) + 1
+            self.__write_games([(planes[start:end], policies[start:end], outcomes[start])
+                                for start, end in zip(np.r_[0, boundaries], np.r_[boundaries, len(game_ids)])])
+            self.imported[shard] = len(self.games)
+            self.__save_imported()
+            self.__save_index()
+            shards.append(shard)
+        return shards
+
+    def arrays(self):
+        # 各字段的只读 memmap，切片不会复制数据
+        if self.__maps is None:
+            total = len(self)
+            self.__maps = {name: np.memmap(self.__file(name), dtype=dtype, mode='r', shape=(total,) + shape)
+                           for name, (dtype, shape) in FIELDS.items()} if total else None
+        return self.__maps
+
+    def window(self, games=None):
+        # 最近 games 局对应的局面区间 [start, end)
+        if games is None or games >= len(self.games):
+            return 0, len(self)
+        return int(self.games[-games, 0]), len(self)
+
+    def sample(self, batch_size, window_games=None, rng=None):
+        rng = np.random.default_rng() if rng is None else rng
+        start, end = self.window(window_games)
+        # 排序后按顺序读 memmap，磁盘访问更连续
+        indices = np.sort(rng.integers(start, end, size=batch_size))
+        maps = self.arrays()
+        return tuple(np.take(maps[name], indices, axis=0) for name in FIELDS)
+
+    def stream(self, batch_size, window_games=None, prefetch=4, seed=None, steps=None, transform=None):
+        """后台线程预取的 (x, (policy, value)) 批次生成器，可直接交给 Model.fit。
+
+        transform(batch, rng) 在后台线程里对每个批次做变换（例如数据增强），与训练计算重叠。
+        """
+        batches = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+
+        def produce():
+            rng = np.random.default_rng(seed)
+            step = 0
+            while not stop.is_set() and (steps is None or step < steps):
+                planes, policies, outcomes = self.sample(batch_size, window_games, rng)
+                batch = (planes.astype(np.float32),
+                         (policies.astype(np.float32), outcomes.astype(np.float32).reshape(-1, 1)))
+                if transform is not None:
+                    batch = transform(batch, rng)
+                while not stop.is_set():
+                    try:
+                        batches.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                step += 1
+            if not stop.is_set():
+                batches.put(None)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    return
+                yield batch
+        finally:
+            stop.set()
+
+    def dataset(self, batch_size, window_games=None, prefetch=4, seed=None, transform=None):
+        # tf.data 版本，需要 tensorflow
+        import tensorflow as tf
+
+        return tf.data.Dataset.from_generator(
+            lambda: self.stream(batch_size, window_games, prefetch, seed, transform=transform),
+            output_signature=(
+                tf.TensorSpec((None, 10, 9, 9), tf.float32),
+                (tf.TensorSpec((None, len(uci_labels)), tf.float32), tf.TensorSpec((None, 1), tf.float32)),
+            )).prefetch(tf.data.AUTOTUNE)
+
+    def __write_games(self, games):
+        # 把若干局追加到记录文件，每个文件只打开一次；索引只更新内存里的 self.games，由调用方保存
+        if len(games) == 0:
+            return
+        counts = [len(planes) for planes, _, _ in games]
+        records = {
+            'planes': [planes for planes, _, _ in games],
+            'policies': [policies for _, policies, _ in games],
+            'outcomes': [np.full(count, outcome) for (_, _, outcome), count in zip(games, counts)],
+        }
+        for name, (dtype, shape) in FIELDS.items():
+            with open(self.__file(name), 'ab') as f:
+                for data, count in zip(records[name], counts):
+                    f.write(np.ascontiguousarray(data, dtype=dtype).reshape((count,) + shape).tobytes())
+
+        starts = len(self) + np.cumsum([0] + counts[:-1])
+        self.games = np.concatenate([self.games, np.stack([starts, counts], axis=1).astype(np.int64)])
+        self.__maps = None
+
+    def __save_index(self):
+        # 先写临时文件再替换，中断时 games.npy 要么是旧的要么是新的
+        index_path = os.path.join(self.path, INDEX_FILE)
+        with open(index_path + '.tmp', 'wb') as f:
+            np.save(f, self.games)
+        os.replace(index_path + '.tmp', index_path)
+
+    def __save_imported(self):
+        imported_path = os.path.join(self.path, IMPORTED_FILE)
+        with open(imported_path + '.tmp', 'w') as f:
+            json.dump(self.imported, f, indent=1)
+        os.replace(imported_path + '.tmp', imported_path)
+
+    def __truncate_records(self):
+        # 记录文件比索引覆盖的局面多时截掉多余部分，否则之后追加的对局会按错误的偏移建索引
+        total = len(self)
+        for name, (dtype, shape) in FIELDS.items():
+            path = self.__file(name)
+            size = total * np.dtype(dtype).itemsize * int(np.prod(shape))
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def __file(self, name):
+        return os.path.join(self.path, name + '.bin')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='import selfplay.py shards into the replay buffer read by train.py')
+    parser.add_argument('--buffer', default='data/replay')
+    parser.add_argument('--shards', default=os.path.join('data/selfplay', 'selfplay-*.npz'),
+                        help='glob of shards to import; shards already in the buffer are skipped')
+    args = parser.parse_args()
+
+    buffer = ReplayBuffer(args.buffer)
+    games, positions = buffer.num_games(), len(buffer)
+    shards = buffer.import_shards(args.shards)
+    print('imported {} shards, {} games, {} positions; buffer has {} games, {} positions'.format(
+        len(shards), buffer.num_games() - games, len(buffer) - positions, buffer.num_games(), len(buffer)))
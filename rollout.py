@@ -0,0 +1,119 @@
+import math
+import random
+import time
+
+from Board import (ADVISOR, BISHOP, BLACK, CANNON, COLS, EMPTY, KING, KNIGHT, NUM_SQUARES, PAWN, PIECE_CHARS,
+                   POSITIONS, ROOK, Board)
+
+# 子力价值，按棋子类型（code & 7）索引；将帅只用于 MVV-LVA 排序，不计入局面子力
+PIECE_TYPE_VALUES = {KING: 100.0, ROOK: 9.0, CANNON: 4.5, KNIGHT: 4.0, BISHOP: 2.0, ADVISOR: 2.0, PAWN: 1.0}
+PIECE_VALUES = tuple(PIECE_TYPE_VALUES.get(code & 7, .0) for code in range(len(PIECE_CHARS)))
+# 过河兵按 2 计
+CROSSED_PAWN_VALUE = 2.0
+# 子力差经 tanh(diff / MATERIAL_SCALE) 映射到 (-1, 1)，差一个车约为 0.7
+MATERIAL_SCALE = 10.0
+MAX_PLIES = 80
+
+
+def material_score(board: Board):
+    # 红方视角的子力评估，范围 (-1, 1)
+    balance = .0
+    for square, piece in enumerate(board.squares):
+        if piece == EMPTY or piece & 7 == KING:
+            continue
+        value = PIECE_VALUES[piece]
+        if piece & 7 == PAWN:
+            row = square // COLS
+            if (row >= 5) if piece & BLACK else (row <= 4):
+                value = CROSSED_PAWN_VALUE
+        balance += -value if piece & BLACK else value
+    return math.tanh(balance / MATERIAL_SCALE)
+
+
+def choose_move(board: Board, rng=random):
+    """轻量走子策略：有吃子时按 MVV-LVA（先吃最值钱的子，再用最便宜的子去吃）走，否则随机走一步不吃子的棋。
+
+    为了速度不过滤送将的走法，送将后对方会直接吃掉将帅结束 rollout。返回 (起点格, 终点格)，没有可走的棋时返回 None。
+    """
+    squares = board.squares
+    black = board.is_black_turn()
+    best_capture = None
+    best_key = -1.0
+    quiet = []
+    for square in range(NUM_SQUARES):
+        piece = squares[square]
+        if piece == EMPTY or (piece & BLACK != 0) != black:
+            continue
+        for target in board._piece_moves(square):
+            victim = squares[target]
+            if victim == EMPTY:
+                quiet.append((square, target))
+            else:
+                key = PIECE_VALUES[victim] * 16 - PIECE_VALUES[piece]
+                if key > best_key:
+                    best_key = key
+                    best_capture = (square, target)
+    if best_capture is not None:
+        return best_capture
+    return rng.choice(quiet) if len(quiet) != 0 else None
+
+
+def rollout(board: Board, max_plies=MAX_PLIES, rng=random):
+    """从 board 原地走到终局或 max_plies 步，返回红方视角的结果：终局为 1 / -1 / 0，到步数上限时为子力评估。
+
+    走子都通过 make_move / unmake_move 完成，结束后 board 恢复原状，不复制局面。
+    """
+    undo_stack = []
+    try:
+        for _ in range(max_plies):
+            if board.is_game_over() or board.is_draw():
+                break
+            move = choose_move(board, rng)
+            if move is None:
+                break
+            src, dst = move
+            undo_stack.append(board.make_move(POSITIONS[src], POSITIONS[dst]))
+
+        if board.is_red_win():
+            return 1.0
+        if board.is_black_win():
+            return -1.0
+        if board.is_draw():
+            return .0
+        return material_score(board)
+    finally:
+        for undo in reversed(undo_stack):
+            board.unmake_move(undo)
+
+
+def measure_rollouts(board=None, count=200, max_plies=MAX_PLIES, seed=0):
+    board = Board() if board is None else board
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    for _ in range(count):
+        hash_before = board.zobrist_hash()
+        rollout(board, max_plies, rng)
+        assert board.zobrist_hash() == hash_before, "rollout did not restore the board"
+    elapsed = time.perf_counter() - start
+    return {'rollouts_per_second': count / elapsed, 'max_plies': max_plies, 'seconds': elapsed}
+
+
+def test_rollout():
+    board = Board()
+    before = board.encode()
+    scores = [rollout(board, rng=random.Random(seed)) for seed in range(20)]
+    assert board.encode() == before, "rollout changed the board"
+    assert all(-1.0 <= score <= 1.0 for score in scores), "rollout score out of range"
+    assert material_score(Board()) == .0, "initial position is not balanced"
+
+    # 红车可以吃黑车，也可以吃兵：MVV-LVA 先吃车
+    rows = [['_'] * COLS for _ in range(10)]
+    rows[0][4], rows[9][4] = 'k', 'K'
+    rows[5][0], rows[5][3], rows[2][0], rows[6][4] = 'R', 'p', 'r', 'P'
+    board = Board(rows)
+    assert choose_move(board) == (5 * COLS + 0, 2 * COLS + 0), "rook should capture the rook first"
+
+
+if __name__ == '__main__':
+    test_rollout()
+    print(measure_rollouts())
@@ -0,0 +1,152 @@
+import argparse
+import multiprocessing
+import os
+import random
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from Board import Board
+from encoder import to_tensor
+from mcts import SearchSession
+from parallel import init_worker
+from uci import get_label_index, uci_labels
+
+# 分片文件名，编号在同一目录内递增
+SHARD_NAME = 'selfplay-{:05d}.npz'
+SHARD_PATTERN = re.compile(r'selfplay-(\d+)\.npz')
+
+
+def visit_policy(root):
+    # 根节点各子节点访问次数归一化后的分布，按 uci_labels 排列
+    policy = np.zeros(len(uci_labels), dtype=np.float32)
+    for child in root.get_children():
+        policy[get_label_index(*root.get_child_move(child))] = child.get_visits()
+    total = policy.sum()
+    return policy / total if total > 0 else policy
+
+
+def play_game(search_numbers=100, max_moves=200, sample_moves=10, seed=None, verbose=0, **search_options):
+    """自我对弈一局，返回 (planes, policies, outcome)，outcome 以红方为正：1 红胜，-1 黑胜，0 和棋或未分胜负。
+
+    verbose 传给 Mcts.search，默认不输出，避免每步都打印根节点和子节点。
+    """
+    rng = random.Random(seed)
+    random.seed(seed)
+    board = Board()
+    session = SearchSession(board, verbose=verbose, **search_options)
+    planes, policies = [], []
+
+    while not board.is_game_over() and not board.is_draw() and len(planes) < max_moves:
+        move = session.search(search_numbers)
+        root = session.root
+        policy = visit_policy(root)
+        planes.append(to_tensor(root))
+        policies.append(policy)
+
+        if len(planes) <= sample_moves and policy.sum() > 0:
+            # 开局若干步按访问次数采样，增加对局多样性
+            children = list(root.get_children())
+            move = root.get_child_move(rng.choices(children, weights=[c.get_visits() for c in children])[0])
+
+        board = board.move(*move)
+        session.advance(move)
+
+    outcome = 1 if board.is_red_win() else -1 if board.is_black_win() else 0
+    return np.array(planes, dtype=np.int8).reshape(-1, 10, 9, 9), np.array(policies, dtype=np.float32), outcome
+
+
+def _play(seed, search_numbers, max_moves, search_options):
+    start = time.perf_counter()
+    planes, policies, outcome = play_game(search_numbers, max_moves, seed=seed, **search_options)
+    return planes, policies, outcome, time.perf_counter() - start
+
+
+class ShardWriter:
+    """攒够 chunk_size 个局面后写一个压缩分片，避免每个局面一个文件。"""
+
+    def __init__(self, out_dir, chunk_size=16384):
+        self.out_dir = out_dir
+        self.chunk_size = chunk_size
+        self.shards = 0
+        self.games = 0
+        self.buffer = []
+        os.makedirs(out_dir, exist_ok=True)
+        # 编号接在目录里已有分片之后，再次写入同一目录不会覆盖上次还没导入的分片
+        existing = [int(match.group(1)) for match in map(SHARD_PATTERN.fullmatch, os.listdir(out_dir)) if match]
+        self.first_shard = max(existing, default=-1) + 1
+
+    def add(self, planes, policies, outcome):
+        self.buffer.append((planes, policies, np.full(len(planes), outcome, dtype=np.int8),
+                            np.full(len(planes), self.games, dtype=np.int32)))
+        self.games += 1
+        if sum(len(item[0]) for item in self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+        path = os.path.join(self.out_dir, SHARD_NAME.format(self.first_shard + self.shards))
+        np.savez_compressed(
+            path,
+            planes=np.concatenate([item[0] for item in self.buffer]),
+            policies=np.concatenate([item[1] for item in self.buffer]).astype(np.float16),
+            outcomes=np.concatenate([item[2] for item in self.buffer]),
+            game_ids=np.concatenate([item[3] for item in self.buffer]),
+        )
+        self.shards += 1
+        self.buffer = []
+
+
+def run_selfplay(games, out_dir, workers=4, search_numbers=100, max_moves=200, chunk_size=16384, seed=0,
+                 server=None, **search_options):
+    # server 为已启动的 InferenceServer 时，对弈进程共用它的模型
+    initargs = () if server is None else (server.clients[:workers], multiprocessing.Value('i', 0))
+    writer = ShardWriter(out_dir, chunk_size)
+    positions = 0
+    busy = 0.0
+    seeds = random.Random(seed).sample(range(1 << 30), games)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs) as executor:
+        futures = [executor.submit(_play, game_seed, search_numbers, max_moves, search_options) for game_seed in seeds]
+        for future in as_completed(futures):
+            planes, policies, outcome, elapsed = future.result()
+            writer.add(planes, policies, outcome)
+            positions += len(planes)
+            busy += elapsed
+    writer.flush()
+    wall = time.perf_counter() - start
+
+    return {
+        'games': games,
+        'positions': positions,
+        'shards': writer.shards,
+        'seconds': wall,
+        'games_per_hour': games / wall * 3600,
+        'positions_per_second': positions / wall,
+        'worker_utilization': busy / (workers * wall),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='self-play training data generator')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--search-numbers', type=int, default=100)
+    parser.add_argument('--max-moves', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--chunk-size', type=int, default=16384)
+    parser.add_argument('--out', default='data/selfplay')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rollout-weight', type=float, default=None,
+                        help='weight of rollouts in leaf values, default 1 without a trained checkpoint, else 0')
+    args = parser.parse_args()
+
+    report = run_selfplay(args.games, args.out, args.workers, args.search_numbers, args.max_moves, args.chunk_size,
+                          args.seed, batch_size=args.batch_size, rollout_weight=args.rollout_weight)
+    print('games {games}, positions {positions}, shards {shards}, {seconds:.1f}s'.format(**report))
+    print('{games_per_hour:.1f} games/hour, {positions_per_second:.1f} positions/s, '
+          'worker utilization {worker_utilization:.0%}'.format(**report))
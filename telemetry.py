@@ -0,0 +1,125 @@
+import cProfile
+import io
+import pstats
+import time
+from collections import defaultdict
+
+# Mcts.search 的阶段：选择（包含走法生成）、走法生成、张量编码、网络推理、rollout、扩展、回传
+PHASES = ('select', 'movegen', 'encode', 'inference', 'rollout', 'expand', 'backup')
+# 互不包含的阶段，剩余时间记为 other
+TOP_LEVEL_PHASES = ('select', 'encode', 'inference', 'rollout', 'expand', 'backup')
+
+
+class SearchTelemetry:
+    """Mcts.search 的分阶段计时与计数。
+
+    只有把实例传给 Mcts.search(telemetry=...) 时才会计时；不传时用 NULL_TELEMETRY，各调用都是空操作。
+    每次搜索开始时清零，结束时把 summary() 交给 callback；profile=True 时整次搜索在 cProfile 下运行。
+    """
+
+    def __init__(self, callback=None, profile=False):
+        self.callback = callback
+        self.profiler = cProfile.Profile() if profile else None
+        self.timings = dict.fromkeys(PHASES, .0)
+        self.counters = defaultdict(int)
+        self.max_depth = 0
+        self.started = None
+        self.seconds = .0
+
+    @staticmethod
+    def clock():
+        return time.perf_counter()
+
+    def add(self, phase, since):
+        # 把 since 到现在的时间记到 phase 上
+        self.timings[phase] += time.perf_counter() - since
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def record_path(self, depth):
+        self.counters['paths'] += 1
+        self.counters['depth_total'] += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def start(self):
+        self.timings = dict.fromkeys(PHASES, .0)
+        self.counters = defaultdict(int)
+        self.max_depth = 0
+        if self.profiler is not None:
+            self.profiler.enable()
+        self.started = time.perf_counter()
+
+    def finish(self, **extra):
+        self.seconds = time.perf_counter() - self.started
+        if self.profiler is not None:
+            self.profiler.disable()
+        summary = self.summary()
+        summary.update(extra)
+        if self.callback is not None:
+            self.callback(summary)
+        return summary
+
+    def summary(self):
+        counters = dict(self.counters)
+        simulations = counters.get('simulations', 0)
+        paths = counters.get('paths', 0)
+        lookups = counters.get('cache_hits', 0) + counters.get('cache_misses', 0)
+        timings = dict(self.timings)
+        timings['other'] = max(.0, self.seconds - sum(timings[phase] for phase in TOP_LEVEL_PHASES))
+        return {
+            'seconds': self.seconds,
+            'simulations': simulations,
+            'simulations_per_second': simulations / self.seconds if self.seconds > 0 else .0,
+            'timings': timings,
+            'counters': counters,
+            'mean_depth': counters.get('depth_total', 0) / paths if paths else .0,
+            'max_depth': self.max_depth,
+            'cache_hit_rate': counters.get('cache_hits', 0) / lookups if lookups else None,
+        }
+
+    def profile_stats(self, sort='cumulative', limit=20):
+        # cProfile 结果的文本报告，profile=False 时返回 None
+        if self.profiler is None:
+            return None
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+
+class NullTelemetry:
+    """接口与 SearchTelemetry 相同、什么也不记录，Mcts.search 没有传 telemetry 时使用。"""
+
+    @staticmethod
+    def clock():
+        return .0
+
+    def add(self, phase, since):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def record_path(self, depth):
+        pass
+
+    def start(self):
+        pass
+
+    def finish(self, **extra):
+        return None
+
+
+NULL_TELEMETRY = NullTelemetry()
+
+
+def format_summary(summary):
+    lines = ['{simulations} simulations in {seconds:.3f}s ({simulations_per_second:.1f}/s), '
+             'depth mean {mean_depth:.2f} max {max_depth}'.format(**summary)]
+    for phase, seconds in summary['timings'].items():
+        share = seconds / summary['seconds'] if summary['seconds'] > 0 else .0
+        lines.append(f'  {phase:<10} {seconds * 1000:10.2f} ms {share:6.1%}')
+    if summary['cache_hit_rate'] is not None:
+        lines.append('  cache hit rate {:.1%}'.format(summary['cache_hit_rate']))
+    lines.append('  counters {}'.format(summary['counters']))
+    return '\n'.join(lines)
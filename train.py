@@ -0,0 +1,116 @@
+import argparse
+import os
+import time
+
+import numpy as np
+from keras.callbacks import Callback
+from keras.losses import CategoricalCrossentropy
+from keras.optimizers import Adam
+
+from net import ARCHITECTURE_OPTIONS, CHECKPOINT_PATH, load_model, resolve_architecture, save_architecture
+from replay_buffer import ReplayBuffer
+from uci import mirror_index
+
+
+def compile_model(model, learning_rate=1e-3, value_loss_weight=1.0):
+    # 策略头输出原始 logits，用 from_logits 的交叉熵拟合访问次数分布；价值头 tanh 输出用均方误差
+    model.compile(optimizer=Adam(learning_rate=learning_rate),
+                  loss=[CategoricalCrossentropy(from_logits=True), 'mean_squared_error'],
+                  loss_weights=[1.0, value_loss_weight])
+    return model
+
+
+def mirror_batch(batch, rng, probability=0.5):
+    """以 probability 的概率把样本左右镜像：棋盘列翻转，策略按 uci_labels 的镜像走法重排。"""
+    planes, (policies, values) = batch
+    flip = rng.random(len(planes)) < probability
+    if flip.any():
+        planes[flip] = planes[flip][:, :, ::-1, :]
+        policies[flip] = policies[flip][:, mirror_index]
+    return planes, (policies, values)
+
+
+class ThroughputLogger(Callback):
+    def __init__(self, samples_per_epoch):
+        super().__init__()
+        self.samples_per_epoch = samples_per_epoch
+        self.start = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self.start
+        print(f"epoch {epoch + 1}: {self.samples_per_epoch / elapsed:.1f} samples/s")
+
+
+class Checkpoint(Callback):
+    # 每个 epoch 结束保存一次权重，并更新 load_model() 默认读取的 latest 检查点；网络结构一起保存
+    def __init__(self, checkpoint_dir, latest_path, architecture=None):
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.latest_path = latest_path
+        self.architecture = architecture or {}
+
+    def on_epoch_end(self, epoch, logs=None):
+        for path in (os.path.join(self.checkpoint_dir, f"model-{epoch + 1:04d}.weights.h5"), self.latest_path):
+            self.model.save_weights(path)
+            save_architecture(path, self.architecture)
+
+
+def train(buffer_path, epochs=10, steps_per_epoch=1000, batch_size=256, window_games=None, learning_rate=1e-3,
+          checkpoint_dir=os.path.dirname(CHECKPOINT_PATH), mirror_probability=0.5, seed=None, model_options=None):
+    # model_options 为 net.create_chinese_chess_model 的网络结构参数，例如 num_filters、num_blocks；
+    # 继续训练已有检查点时默认沿用它保存的结构
+    buffer = ReplayBuffer(buffer_path)
+    if len(buffer) == 0:
+        raise Exception(f"replay buffer {buffer_path} is empty.")
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    latest_path = os.path.join(checkpoint_dir, os.path.basename(CHECKPOINT_PATH))
+    architecture = resolve_architecture(latest_path, **(model_options or {}))
+    model = compile_model(load_model(latest_path, **architecture), learning_rate)
+
+    # 采样、类型转换和镜像增强都在 ReplayBuffer.stream 的后台线程里完成，与训练计算重叠
+    stream = buffer.stream(batch_size, window_games, seed=seed, steps=epochs * steps_per_epoch,
+                           transform=lambda batch, rng: mirror_batch(batch, rng, mirror_probability))
+    history = model.fit(stream, epochs=epochs, steps_per_epoch=steps_per_epoch, verbose=2,
+                        callbacks=[ThroughputLogger(steps_per_epoch * batch_size),
+                                   Checkpoint(checkpoint_dir, latest_path, architecture)])
+    return model, history
+
+
+def test_mirror_batch():
+    from Board import Board
+    from encoder import encode_batch
+    from uci import get_label_index
+
+    board = Board()
+    planes = encode_batch([board])
+    policies = np.zeros((1, len(mirror_index)), dtype=np.float32)
+    policies[0, get_label_index((9, 1), (7, 2))] = 1
+    values = np.zeros((1, 1), dtype=np.float32)
+
+    mirrored, (mirrored_policies, _) = mirror_batch((planes.copy(), (policies.copy(), values)),
+                                                    np.random.default_rng(0), probability=1.0)
+    assert np.array_equal(mirrored[0], planes[0][:, ::-1, :]), "planes are not mirrored"
+    assert mirrored_policies[0, get_label_index((9, 7), (7, 6))] == 1, "policy is not mirrored"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='train the policy/value network from a replay buffer')
+    parser.add_argument('--buffer', default='data/replay')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--steps-per-epoch', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--window-games', type=int, default=None)
+    parser.add_argument('--learning-rate', type=float, default=1e-3)
+    parser.add_argument('--checkpoint-dir', default=os.path.dirname(CHECKPOINT_PATH))
+    # 网络结构，默认沿用检查点保存的结构，没有检查点时为完整网络（256 x 7）
+    for option in ARCHITECTURE_OPTIONS:
+        parser.add_argument('--' + option.replace('_', '-'), type=int, default=None)
+    args = parser.parse_args()
+
+    options = {option: getattr(args, option) for option in ARCHITECTURE_OPTIONS if getattr(args, option) is not None}
+    train(args.buffer, args.epochs, args.steps_per_epoch, args.batch_size, args.window_games, args.learning_rate,
+          args.checkpoint_dir, model_options=options)
@@ -0,0 +1,69 @@
+import heapq
+from collections import OrderedDict
+
+
+class TranspositionTable:
+    """按 Board.table_key()（局面哈希加未吃子步数）共享 TreeNode 的置换表，节点数超过 max_nodes 时按 policy 淘汰。
+
+    policy 为 'lru'（最久未访问）或 'visits'（访问次数最少）。被淘汰的节点仍挂在
+    搜索树上，只是之后不再被其他路径复用。
+    """
+
+    def __init__(self, max_nodes=200000, policy='lru'):
+        if policy not in ('lru', 'visits'):
+            raise ValueError(f"unknown eviction policy: {policy}")
+        self.max_nodes = max_nodes
+        self.policy = policy
+        self.nodes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, key):
+        return key in self.nodes
+
+    def get(self, key):
+        node = self.nodes.get(key)
+        if node is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.policy == 'lru':
+            self.nodes.move_to_end(key)
+        return node
+
+    def put(self, key, node):
+        self.nodes[key] = node
+        if self.policy == 'lru':
+            self.nodes.move_to_end(key)
+        if len(self.nodes) > self.max_nodes:
+            self.__evict()
+
+    def clear(self):
+        self.nodes.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.nodes),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+        }
+
+    def __evict(self):
+        if self.policy == 'lru':
+            self.nodes.popitem(last=False)
+            self.evictions += 1
+            return
+
+        # 一次淘汰约 1/16，避免每插入一个节点都全表扫描
+        count = max(1, len(self.nodes) - self.max_nodes + self.max_nodes // 16)
+        victims = heapq.nsmallest(count, self.nodes.items(), key=lambda item: item[1].get_visits())
+        for key, _ in victims:
+            del self.nodes[key]
+        self.evictions += len(victims)
@@ -1,3 +1,5 @@
+import numpy as np
+
 
 def create_uci_labels():
     labels_array = []
@@ -42,21 +44,57 @@ def to_uci_label(src, dst):
     return uci_label
 
 
-def get_probability(src, dst, policy_pred):
-    # Convert the source and destination coordinates to a UCI label
-    uci_label = to_uci_label(src, dst)
+def create_move_index(labels):
+    # Dense (90 * 90) table: src_square * 90 + dst_square -> index in labels, -1 for moves without a label
+    letters = 'abcdefghi'
+    move_index = np.full(90 * 90, -1, dtype=np.int32)
+    for index, label in enumerate(labels):
+        src = (9 - int(label[1])) * 9 + letters.index(label[0])
+        dst = (9 - int(label[3])) * 9 + letters.index(label[2])
+        if move_index[src * 90 + dst] == -1:
+            move_index[src * 90 + dst] = index
+    return move_index
+
+
+def mirror_uci_label(label):
+    # Left-right mirror of a move: file a <-> i, b <-> h, ...
+    letters = 'abcdefghi'
+    return letters[8 - letters.index(label[0])] + label[1] + letters[8 - letters.index(label[2])] + label[3]
+
+
+def create_mirror_index(labels):
+    # mirror_index[i] is the index of the mirrored move of labels[i]
+    positions = {label: index for index, label in enumerate(labels)}
+    return np.array([positions[mirror_uci_label(label)] for label in labels], dtype=np.int32)
+
+
+def get_label_index(src, dst):
+    return int(move_index[(src[0] * 9 + src[1]) * 90 + dst[0] * 9 + dst[1]])
 
-    # Create the UCI labels array
-    # Find the index of the UCI label in the labels array
-    label_index = uci_labels.index(uci_label)
 
+def get_label_indices(moves):
+    # Map a list of ((x, y), (x, y)) moves to their indices in uci_labels in one gather
+    coordinates = np.asarray(moves, dtype=np.intp).reshape(-1, 4)
+    return move_index[(coordinates[:, 0] * 9 + coordinates[:, 1]) * 90 + coordinates[:, 2] * 9 + coordinates[:, 3]]
+
+
+def get_probability(src, dst, policy_pred):
     # Get the probability from the policy prediction vector
-    probability = policy_pred[label_index]
+    return policy_pred[get_label_index(src, dst)]
+
 
-    return probability
+def get_priors(moves, policy_pred):
+    # Gather the logits of the legal moves and normalize them with a softmax over those moves only
+    logits = np.asarray(policy_pred, dtype=np.float64)[get_label_indices(moves)]
+    if len(logits) == 0:
+        return logits
+    priors = np.exp(logits - logits.max())
+    return priors / priors.sum()
 
 
 uci_labels = create_uci_labels()
+move_index = create_move_index(uci_labels)
+mirror_index = create_mirror_index(uci_labels)
 
 
 def test_uci():
@@ -66,6 +104,18 @@ def test_uci():
     assert to_uci_label((2, 1), (5, 1)) == 'b7b4', "Error in test case 4"
     assert to_uci_label((3, 0), (4, 0)) == 'a6a5', "Error in test case 5"
 
+    for src, dst in [((0, 4), (1, 4)), ((0, 0), (0, 1)), ((0, 1), (2, 2)), ((2, 1), (5, 1)), ((9, 3), (8, 4))]:
+        assert get_label_index(src, dst) == uci_labels.index(to_uci_label(src, dst)), "Error in move index"
+
+    policy_pred = np.linspace(-3, 3, len(uci_labels), dtype=np.float32)
+    moves = [((9, 1), (7, 2)), ((6, 4), (5, 4))]
+    priors = get_priors(moves, policy_pred)
+    logits = np.array([get_probability(src, dst, policy_pred) for src, dst in moves], dtype=np.float64)
+    assert np.allclose(priors, np.exp(logits) / np.exp(logits).sum()), "Error in priors"
+
+    assert mirror_uci_label('b9c7') == 'h9g7', "Error in mirror label"
+    assert (mirror_index[mirror_index] == np.arange(len(uci_labels))).all(), "Error in mirror index"
+
 
 if __name__ == '__main__':
     test_uci()